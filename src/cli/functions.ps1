@@ -434,9 +434,7 @@ function patchFiles() {
         $fileName = getLatestFileName
         $dictFile = (Join-Path $rootPath (Join-Path 'hex_tables' $fileName))
         $pythonExe = 'python'
-        $updateArgs = $patcherPath, '-m', 'update', '-p', (Join-Path $SFSEPath 'sfse'), '-d', "$dictFile"
-        $patchArgs = $patcherPath, '-m', 'patch', '-p', $SFSEPath
-        $verifyArgs = $patcherPath, '-m', 'md5', '-p', $SFSEPath, '--verify'
+        $pipelineArgs = $patcherPath, '-m', 'pipeline', '-p', $SFSEPath, '-d', "$dictFile"
 
         if (([System.Convert]::ToBoolean((getConfigProperty "standalonePython")))) {
             installStandalonePython
@@ -445,14 +443,8 @@ function patchFiles() {
 
         writeToConsole "`n`tPatching SFSE" -log
 
-        # Update hex values
-        & $pythonExe $updateArgs | Out-File $LogPath -Append -Encoding UTF8
-
-        # Patch loader
-        & $pythonExe $patchArgs | Out-File $LogPath -Append -Encoding UTF8
-
-        # Verify files were patched
-        $verifyPatch = & $pythonExe $verifyArgs
+        # Update hex values, patch loader and verify files were patched in one run
+        $verifyPatch = & $pythonExe $pipelineArgs
 
         # Log md5 comparison
         $verifyPatch | Out-File $LogPath -Append -Encoding UTF8
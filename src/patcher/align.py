@@ -0,0 +1,164 @@
+# Alignment of the hex lines of two versions of a file, for generating tables
+# when SFSE adds or removes addresses between versions
+#
+# Lines holding a hex value are compared by their text with the hex values
+# masked, so a line keeps its key (e.g. the symbol it declares) when only its
+# address changes. The lines are aligned with a patience diff: lines whose key
+# is unique in both versions are anchors, the longest run of anchors in the
+# same order is kept and the gaps between them are aligned the same way. A gap
+# left without anchors is paired line by line if both sides have as many lines,
+# otherwise its lines are reported as unaligned.
+
+from bisect import bisect_left
+from collections import Counter
+from common import STATS
+
+
+def longest_increasing_run(anchors):
+    # Longest subsequence of (old, new) anchors, sorted by old, whose new also increases
+    tails = []
+    tail_idx = []
+    previous = [None] * len(anchors)
+
+    for idx, (_, new) in enumerate(anchors):
+        pos = bisect_left(tails, new)
+        if pos == len(tails):
+            tails.append(new)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = new
+            tail_idx[pos] = idx
+        previous[idx] = tail_idx[pos - 1] if pos else None
+
+    run = []
+    idx = tail_idx[-1] if tail_idx else None
+    while idx is not None:
+        run.append(anchors[idx])
+        idx = previous[idx]
+
+    return run[::-1]
+
+
+def unique_anchors(old_keys, new_keys, old_lo, old_hi, new_lo, new_hi):
+    old_counts = Counter(old_keys[old_lo:old_hi])
+    new_counts = Counter(new_keys[new_lo:new_hi])
+
+    new_positions = {}
+    for idx in range(new_lo, new_hi):
+        key = new_keys[idx]
+        if new_counts[key] == 1 and old_counts[key] == 1:
+            new_positions[key] = idx
+
+    return [(idx, new_positions[old_keys[idx]]) for idx in range(old_lo, old_hi)
+            if old_keys[idx] in new_positions]
+
+
+def align(old_keys, new_keys):
+    # Returns the aligned (old, new) line pairs in order, and the gaps that couldn't
+    # be aligned as (old_lo, old_hi, new_lo, new_hi)
+    pairs = []
+    unaligned = []
+    ranges = [(0, len(old_keys), 0, len(new_keys))]
+
+    while ranges:
+        old_lo, old_hi, new_lo, new_hi = ranges.pop()
+
+        # Matching lines at either end need no anchors
+        while old_lo < old_hi and new_lo < new_hi and old_keys[old_lo] == new_keys[new_lo]:
+            pairs.append((old_lo, new_lo))
+            old_lo += 1
+            new_lo += 1
+
+        while old_lo < old_hi and new_lo < new_hi and old_keys[old_hi - 1] == new_keys[new_hi - 1]:
+            old_hi -= 1
+            new_hi -= 1
+            pairs.append((old_hi, new_hi))
+
+        if old_lo == old_hi and new_lo == new_hi:
+            continue
+
+        anchors = []
+        if old_lo < old_hi and new_lo < new_hi:
+            anchors = longest_increasing_run(unique_anchors(old_keys, new_keys, old_lo, old_hi, new_lo, new_hi))
+
+        if not anchors:
+            if old_hi - old_lo == new_hi - new_lo:
+                # Same number of lines, most likely the same lines changed
+                STATS.count('aligned_by_position', old_hi - old_lo)
+                pairs.extend(zip(range(old_lo, old_hi), range(new_lo, new_hi)))
+            else:
+                unaligned.append((old_lo, old_hi, new_lo, new_hi))
+            continue
+
+        pairs.extend(anchors)
+
+        # Gaps before, between and after the anchors
+        bounds = [(old_lo - 1, new_lo - 1)] + anchors + [(old_hi, new_hi)]
+        for (old_start, new_start), (old_end, new_end) in zip(bounds, bounds[1:]):
+            if old_end - old_start > 1 or new_end - new_start > 1:
+                ranges.append((old_start + 1, old_end, new_start + 1, new_end))
+
+    pairs.sort()
+    unaligned.sort()
+
+    return pairs, unaligned
+
+
+class AlignmentReport:
+    # Lines that couldn't be aligned and addresses paired with several new addresses
+
+    def __init__(self):
+        self.unaligned = []
+        self.values = {}
+        self.conflicts = {}
+
+    def add_unaligned(self, file, old_lines, new_lines):
+        # Lines are (line number, hex value)
+        self.unaligned.append({'file': file, 'old': old_lines, 'new': new_lines})
+
+    def track(self, pairs):
+        # Passes the pairs on, noting old addresses already paired with another value
+        for old_hex, new_hex in pairs:
+            value = self.values.setdefault(old_hex, new_hex)
+            if value != new_hex:
+                self.conflicts.setdefault(old_hex, {value}).add(new_hex)
+
+            yield old_hex, new_hex
+
+    def total(self):
+        return sum(len(entry['old']) + len(entry['new']) for entry in self.unaligned) + len(self.conflicts)
+
+    def summary(self, limit=10):
+        lines = ["{0} lines in {1} files couldn't be aligned and {2} addresses have several new values, "
+                 "check them before using the table".format(
+                     sum(len(entry['old']) + len(entry['new']) for entry in self.unaligned),
+                     len(set(entry['file'] for entry in self.unaligned)), len(self.conflicts))]
+
+        for entry in self.unaligned[:limit]:
+            lines.append("  {0}: {1} old lines, {2} new lines from line {3}".format(
+                entry['file'], len(entry['old']), len(entry['new']),
+                (entry['old'] or entry['new'])[0][0]))
+
+        if len(self.unaligned) > limit:
+            lines.append("  ... and {} more".format(len(self.unaligned) - limit))
+
+        for old_hex in sorted(self.conflicts)[:limit]:
+            lines.append("  {0}: {1}".format(old_hex, ', '.join(sorted(self.conflicts[old_hex]))))
+
+        if len(self.conflicts) > limit:
+            lines.append("  ... and {} more".format(len(self.conflicts) - limit))
+
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {
+            'unaligned': self.unaligned,
+            'conflicts': [{'address': old_hex, 'values': sorted(values)}
+                          for old_hex, values in sorted(self.conflicts.items())]
+        }
+
+    def write(self, path):
+        import json
+
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
@@ -0,0 +1,396 @@
+# Benchmarks the patcher against synthetic SFSE-like trees, no game files needed
+#
+# Builds an old and new source tree of configurable size along with a hex table,
+# then times generate, update, patch and md5 end to end and reports the throughput,
+# along with the time each run spent in the patcher's own stages (--profile).
+# Results can be written as json to compare releases.
+
+import getopt
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from shutil import copytree
+from tempfile import TemporaryDirectory
+
+import common
+from generate import generate_hex_dict_for_dir
+from patch import patch
+from update import update_files
+
+try:
+    import resource
+except ImportError:
+    # Not available on windows
+    resource = None
+
+# Line counts of the synthetic loader files, the ones the shipped patch spec is anchored to
+LOADER_FILE_LINES = {
+    'main.cpp': 386,
+    'IdentifyEXE.cpp': 487
+}
+
+PATCHER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patcher.py')
+
+# Import time of each command as a multiple of the interpreter's own startup, both
+# measured with -X importtime so they scale together with the machine. Going over
+# is only reported, absolute times vary too much between runs to fail on them.
+# Modules listed as deferred must not be imported at all, that fails the run
+STARTUP_BUDGET = {
+    'version': {'args': ['-v'], 'ratio': 3.5},
+    'help': {'args': ['-h'], 'ratio': 3.5},
+    'md5_verify': {'args': ['-m', 'md5', '--verify', '--no-index', '-s', '-p', '{root}'], 'ratio': 4.5}
+}
+DEFERRED_MODULES = {
+    'version': ('hashlib', 'json', 'glob', 'tempfile', 'shutil', 'update', 'generate', 'patch', 'pipeline'),
+    'help': ('hashlib', 'json', 'glob', 'tempfile', 'shutil', 'update', 'generate', 'patch', 'pipeline'),
+    'md5_verify': ('json', 'tempfile', 'shutil', 'concurrent.futures', 'threading', 'update', 'generate', 'patch',
+                   'pipeline')
+}
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, linux kilobytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def generate_table(rng, size):
+    # Old addresses are unique so the generated table pairs them back exactly
+    old_addrs = rng.sample(range(0x00100000, 0x07FFFFFF), size)
+    table = {}
+
+    for addr in old_addrs:
+        table['0x{:08X}'.format(addr)] = '0x{:08X}'.format(addr + rng.randrange(0x10, 0x10000, 0x10))
+
+    return table
+
+
+def write_tree(root, keys, table, rng, files, lines, density):
+    # Writes matching old and new trees, every line with a hex value uses one address
+    old_dir = os.path.join(root, 'old', 'sfse')
+    new_dir = os.path.join(root, 'new', 'sfse')
+    os.makedirs(old_dir)
+    os.makedirs(new_dir)
+    os.makedirs(os.path.join(root, 'old', 'sfse_loader'))
+
+    hex_count = 0
+    key_idx = 0
+
+    for file_idx in range(files):
+        name = 'Hooks_{0}.{1}'.format(file_idx, ('cpp', 'h', 'inl')[file_idx % 3])
+        old_lines = []
+        new_lines = []
+
+        for line_idx in range(lines):
+            if rng.random() < density:
+                old_hex = keys[key_idx % len(keys)]
+                key_idx += 1
+                hex_count += 1
+                line = '\tRelocAddr <_Func_{0}> Func_{0}({1});\n'.format(line_idx, '{}')
+                old_lines.append(line.format(old_hex))
+                new_lines.append(line.format(table[old_hex]))
+            else:
+                line = '\tstatic const UInt32 kValue_{0} = {0};\n'.format(line_idx)
+                old_lines.append(line)
+                new_lines.append(line)
+
+        with open(os.path.join(old_dir, name), 'w') as f:
+            f.writelines(old_lines)
+        with open(os.path.join(new_dir, name), 'w') as f:
+            f.writelines(new_lines)
+
+    # Loader files matching the patch spec's line anchors, sfse ones are in both trees
+    for tree, directory, name in (('old', 'sfse', 'main.cpp'), ('new', 'sfse', 'main.cpp'),
+                                  ('old', 'sfse_loader', 'main.cpp'), ('old', 'sfse_loader', 'IdentifyEXE.cpp')):
+        with open(os.path.join(root, tree, directory, name), 'w') as f:
+            for line_idx in range(LOADER_FILE_LINES[name]):
+                f.write('\tif (steamVersion) _MESSAGE("Steam %d", {});\n'.format(line_idx))
+
+    return hex_count
+
+
+def tree_stats(path):
+    files = [os.path.join(path, name) for name in common.get_files(path)]
+
+    return files, sum(os.path.getsize(file) for file in files)
+
+
+def time_stage(name, func, repeat, setup=None):
+    # Best of repeat runs, setup isn't timed and output of the patcher is discarded.
+    # The profile of the best run is kept, its stages are the ones --profile prints
+    best = None
+    profile = None
+    result = None
+
+    for _ in range(repeat):
+        common._checksum_cache.clear()
+        args = () if setup is None else (setup(),)
+
+        # Left over from setup or the previous run
+        common.STATS.snapshot()
+        common.STATS.enabled = True
+
+        try:
+            with redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                result = func(*args)
+                elapsed = time.perf_counter() - start
+        finally:
+            common.STATS.enabled = False
+
+        if best is None or elapsed < best:
+            best = elapsed
+            profile = common.STATS.to_dict(elapsed)
+
+        common.STATS.snapshot()
+
+    # High-water mark of the whole process so far, not the stage's own peak
+    return {'stage': name, 'seconds': best, 'profile': {'stages': profile['stages'], 'counters': profile['counters']},
+            'process_peak_rss': peak_rss()}, result
+
+
+def throughput(stage, files=None, size=None, lookups=None):
+    seconds = stage['seconds'] or 1e-9
+
+    if files is not None:
+        stage['files_per_sec'] = files / seconds
+    if size is not None:
+        stage['mb_per_sec'] = size / seconds / (1024 * 1024)
+    if lookups is not None:
+        stage['lookups_per_sec'] = lookups / seconds
+
+    return stage
+
+
+def import_times(args):
+    # Self import time of every module imported by a fresh interpreter, in seconds
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        self_time, _, name = line[len('import time:'):].split('|')
+        if self_time.strip().isdigit():
+            modules[name.strip()] = int(self_time) / 1e6
+
+    return modules
+
+
+def measure_startup(root, repeat):
+    # Best of repeat runs of each command against the best interpreter startup.
+    # The bytecode is cached first like it is for users, even when python is
+    # told not to write it, as compiling the modules would be timed otherwise
+    import compileall
+
+    compileall.compile_dir(os.path.dirname(PATCHER_PATH), maxlevels=0, quiet=1)
+
+    baseline = min(sum(import_times(['-c', 'pass']).values()) for _ in range(repeat))
+    startup = []
+
+    for name, budget in STARTUP_BUDGET.items():
+        args = [PATCHER_PATH] + [arg.format(root=root) for arg in budget['args']]
+        runs = [import_times(args) for _ in range(repeat)]
+        best = min(sum(modules.values()) for modules in runs)
+        imported = [module for module in DEFERRED_MODULES[name] if module in runs[0]]
+
+        startup.append({
+            'command': name,
+            'seconds': max(0.0, best - baseline),
+            'ratio': best / baseline,
+            'budget_ratio': budget['ratio'],
+            'deferred_imported': imported,
+            'within_budget': best / baseline <= budget['ratio']
+        })
+
+    return startup
+
+
+def run_benchmark(files=200, lines=500, density=0.3, table_size=20000, repeat=1, jobs=1, seed=1):
+    rng = random.Random(seed)
+    table = generate_table(rng, table_size)
+    keys = list(table)
+    stages = []
+
+    with TemporaryDirectory() as root:
+        hex_count = write_tree(root, keys, table, rng, files, lines, density)
+        old_path = os.path.join(root, 'old', 'sfse')
+        new_path = os.path.join(root, 'new', 'sfse')
+        table_path = os.path.join(root, 'hex_table.json')
+
+        with open(table_path, 'w') as f:
+            json.dump(table, f)
+
+        source_files, source_size = tree_stats(old_path)
+        start = time.perf_counter()
+
+        # generate reads both trees
+        stage, _ = time_stage('generate', lambda: generate_hex_dict_for_dir(
+            old_path, new_path, os.path.join(root, 'generated.json'), True), repeat)
+        stages.append(throughput(stage, len(source_files) * 2, source_size * 2, hex_count))
+
+        stage, hex_dict = time_stage('load_table', lambda: common.get_dict(table_path), repeat)
+        stages.append(throughput(stage, lookups=len(hex_dict)))
+
+        lookup_keys = [keys[rng.randrange(len(keys))] for _ in range(100000)]
+        stage, _ = time_stage('lookup', lambda: [hex_dict.get(key) for key in lookup_keys], repeat)
+        stages.append(throughput(stage, lookups=len(lookup_keys)))
+
+        # update and patch change the tree, so each run works on a fresh copy
+        def copy_tree():
+            target = os.path.join(root, 'run_{}'.format(time.perf_counter_ns()))
+            copytree(os.path.join(root, 'old'), target)
+            return target
+
+        def update_tree(target):
+            sfse_path = os.path.join(target, 'sfse')
+            update_files([os.path.join(sfse_path, name) for name in common.get_files(sfse_path)],
+                         hex_dict, False, jobs)
+
+        stage, _ = time_stage('update', update_tree, repeat, copy_tree)
+        stages.append(throughput(stage, len(source_files), source_size, hex_count))
+
+        stage, _ = time_stage('patch', lambda target: patch(target, True, False), repeat, copy_tree)
+        stages.append(throughput(stage, len(LOADER_FILE_LINES) + 1))
+
+        stage, _ = time_stage('md5', lambda: [common.generate_checksum(file, True) for file in source_files], repeat)
+        stages.append(throughput(stage, len(source_files), source_size))
+
+        total = time.perf_counter() - start
+
+        startup = measure_startup(os.path.join(root, 'old'), max(3, repeat))
+
+    return {
+        'patcher_version': common.VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'files': files,
+            'lines': lines,
+            'density': density,
+            'table_size': table_size,
+            'repeat': repeat,
+            'jobs': jobs,
+            'seed': seed
+        },
+        'tree': {
+            'files': len(source_files),
+            'bytes': source_size,
+            'hex_values': hex_count
+        },
+        'total_seconds': total,
+        'process_peak_rss': peak_rss(),
+        'stages': stages,
+        'startup': startup
+    }
+
+
+def print_report(results):
+    print("Patcher v{0} on python {1}".format(results['patcher_version'], results['python']))
+    print("Tree: {files} files, {bytes} bytes, {hex_values} hex values".format(**results['tree']))
+
+    for stage in results['stages']:
+        line = "  {0:<12}{1:>10.4f}s".format(stage['stage'], stage['seconds'])
+
+        if 'files_per_sec' in stage:
+            line += "{0:>12.1f} files/s".format(stage['files_per_sec'])
+        if 'mb_per_sec' in stage:
+            line += "{0:>10.2f} MB/s".format(stage['mb_per_sec'])
+        if 'lookups_per_sec' in stage:
+            line += "{0:>14.0f} lookups/s".format(stage['lookups_per_sec'])
+
+        print(line)
+
+        for profile_stage, timing in sorted(stage['profile']['stages'].items(), key=lambda item: -item[1]['seconds']):
+            print("    {0:<18}{1:>8.4f}s {2:>8} calls".format(profile_stage, timing['seconds'], timing['calls']))
+
+    print("Startup (import time over the interpreter's, and as a multiple of it)")
+    for command in results['startup']:
+        line = "  {0:<12}{1:>10.4f}s{2:>8.1f}x  budget {3:.1f}x".format(
+            command['command'], command['seconds'], command['ratio'], command['budget_ratio'])
+
+        if command['deferred_imported']:
+            line += "  imports {}".format(', '.join(command['deferred_imported']))
+        if not command['within_budget']:
+            line += "  OVER BUDGET"
+
+        print(line)
+
+    print("Total: {0:.4f}s".format(results['total_seconds']))
+    if results['process_peak_rss'] is not None:
+        print("Process peak RSS: {0:.1f} MB".format(results['process_peak_rss'] / (1024 * 1024)))
+
+
+def main(argv):
+    help_info = """
+        bench.py <options>
+
+        <Options>
+            -h, --help
+            --files: Number of source files to generate (default 200)
+            --lines: Number of lines per file (default 500)
+            --density: Fraction of lines holding a hex value (default 0.3)
+            --table: Number of entries in the hex table (default 20000)
+            --repeat: Runs each stage this many times and keeps the best (default 1)
+            -j, --jobs: Number of files to update in parallel, 0 uses every core (default 1)
+            --seed: Seed used to generate the trees (default 1)
+            -o, --output: Write the results as json to this file, use - for stdout
+    """
+    options = {}
+    output = None
+
+    opts, args = getopt.getopt(argv, "hj:o:", [
+                               "help", "files=", "lines=", "density=", "table=", "repeat=",
+                               "jobs=", "seed=", "output="])
+    for opt, arg in opts:
+        if opt in ('-h', "--help"):
+            print(help_info)
+            sys.exit()
+        elif opt == "--files":
+            options['files'] = int(arg)
+        elif opt == "--lines":
+            options['lines'] = int(arg)
+        elif opt == "--density":
+            options['density'] = float(arg)
+        elif opt == "--table":
+            options['table_size'] = int(arg)
+        elif opt == "--repeat":
+            options['repeat'] = max(1, int(arg))
+        elif opt in ("-j", "--jobs"):
+            options['jobs'] = int(arg)
+        elif opt == "--seed":
+            options['seed'] = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    results = run_benchmark(**options)
+
+    if output == '-':
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+        if output:
+            with open(output, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    # Fails the run so CI notices when a command imports what it should defer
+    if any(command['deferred_imported'] for command in results['startup']):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,221 @@
+# Compact binary hex table format, memory mapped so loading a table doesn't
+# build a python string for every address
+#
+# Layout (little endian):
+#   header:        magic (4 bytes), format version (uint32), entry count (uint64)
+#   keys:          count * uint64, old addresses sorted by (address, key format)
+#   values:        count * uint64, new addresses in the same order as the keys
+#   key formats:   count * uint8, how each old address is written
+#   value formats: count * uint8, how each new address is written
+#
+# A format byte keeps the json tables byte for byte, bits 0-4 hold the number of
+# digits, bit 5 is set for lowercase digits, bit 6 for uppercase and bit 7 for a '0X' prefix
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from os import path as ospath
+
+MAGIC = b'SFHT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+EXTENSION = '.bin'
+
+DIGITS_MASK = 0x1F
+LOWER_FLAG = 0x20
+UPPER_FLAG = 0x40
+PREFIX_FLAG = 0x80
+
+
+def hex_format(hex_str):
+    # Returns the format byte of a hex string, or None if it can't be represented
+    digits = hex_str[2:]
+
+    if len(hex_str) < 3 or hex_str[0] != '0' or hex_str[1] not in 'xX' or len(digits) > 16:
+        return None
+
+    fmt = len(digits)
+    if digits != digits.upper():
+        fmt |= LOWER_FLAG
+    if digits != digits.lower():
+        fmt |= UPPER_FLAG
+    if hex_str[1] == 'X':
+        fmt |= PREFIX_FLAG
+
+    # mixed case digits
+    if fmt & LOWER_FLAG and fmt & UPPER_FLAG:
+        return None
+
+    return fmt
+
+
+def format_hex(value, fmt):
+    digits = '{0:0{1}{2}}'.format(value, fmt & DIGITS_MASK, 'x' if fmt & LOWER_FLAG else 'X')
+
+    return '{0}{1}'.format('0X' if fmt & PREFIX_FLAG else '0x', digits)
+
+
+def is_binary_table(path):
+    try:
+        with open(path, 'rb') as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_binary_table(dictionary, path):
+    entries = []
+
+    for key, value in dictionary.items():
+        key_fmt = hex_format(key)
+        value_fmt = hex_format(value)
+
+        if key_fmt is None or value_fmt is None:
+            raise ValueError("Can't store {0}: {1} in a binary table".format(key, value))
+
+        entries.append((int(key, 16), key_fmt, int(value, 16), value_fmt))
+
+    entries.sort()
+
+    keys = array('Q', (entry[0] for entry in entries))
+    values = array('Q', (entry[2] for entry in entries))
+    key_formats = array('B', (entry[1] for entry in entries))
+    value_formats = array('B', (entry[3] for entry in entries))
+
+    if sys.byteorder != 'little':
+        keys.byteswap()
+        values.byteswap()
+
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(entries)))
+        keys.tofile(file)
+        values.tofile(file)
+        key_formats.tofile(file)
+        value_formats.tofile(file)
+
+    return len(entries)
+
+
+def convert_json_table(json_path, out_path=None):
+    if out_path is None:
+        out_path = '{}{}'.format(ospath.splitext(json_path)[0], EXTENSION)
+
+    with open(json_path, 'r') as file:
+        dictionary = json.load(file)
+
+    write_binary_table(dictionary, out_path)
+
+    return out_path
+
+
+class BinaryHexTable:
+    # Read only mapping of old hex string to new hex string, backed by a binary table
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError('{} is not a supported binary hex table'.format(path))
+
+        if len(self._map) != HEADER.size + count * 18:
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+
+        self._count = count
+        view = memoryview(self._map)
+        keys_end = HEADER.size + count * 8
+        values_end = keys_end + count * 8
+        key_formats_end = values_end + count
+
+        if sys.byteorder == 'little':
+            self._keys = view[HEADER.size:keys_end].cast('Q')
+            self._values = view[keys_end:values_end].cast('Q')
+        else:
+            self._keys = array('Q', view[HEADER.size:keys_end])
+            self._values = array('Q', view[keys_end:values_end])
+            self._keys.byteswap()
+            self._values.byteswap()
+
+        self._key_formats = view[values_end:key_formats_end]
+        self._value_formats = view[key_formats_end:]
+
+    def __reduce__(self):
+        # Worker processes map the file again instead of copying it
+        return (BinaryHexTable, (self.path,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for name in ('_keys', '_values', '_key_formats', '_value_formats'):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+
+        self._map.close()
+        self._file.close()
+
+    def _find(self, hex_str):
+        fmt = hex_format(hex_str)
+        if fmt is None:
+            return -1
+
+        try:
+            key = int(hex_str, 16)
+        except ValueError:
+            return -1
+
+        # Several entries can share an address when they're written differently
+        idx = bisect_left(self._keys, key)
+        while idx < self._count and self._keys[idx] == key:
+            if self._key_formats[idx] == fmt:
+                return idx
+            idx += 1
+
+        return -1
+
+    def __getitem__(self, hex_str):
+        idx = self._find(hex_str)
+        if idx < 0:
+            raise KeyError(hex_str)
+
+        return format_hex(self._values[idx], self._value_formats[idx])
+
+    def get(self, hex_str, default=None):
+        idx = self._find(hex_str)
+        if idx < 0:
+            return default
+
+        return format_hex(self._values[idx], self._value_formats[idx])
+
+    def __contains__(self, hex_str):
+        return self._find(hex_str) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        for idx in range(self._count):
+            yield format_hex(self._keys[idx], self._key_formats[idx])
+
+    def values(self):
+        for idx in range(self._count):
+            yield format_hex(self._values[idx], self._value_formats[idx])
+
+    def items(self):
+        for idx in range(self._count):
+            yield (format_hex(self._keys[idx], self._key_formats[idx]),
+                   format_hex(self._values[idx], self._value_formats[idx]))
@@ -0,0 +1,166 @@
+# Change manifests, what update, patch or pipeline would change without writing anything
+#
+# A dry run records every change it would make:
+#   {
+#     "format": 1,
+#     "version": <script version>,
+#     "mode": "update" | "patch" | "pipeline",
+#     "table": <hex table or null>,
+#     "table_checksum": <md5 of the hex table or null>,
+#     "files": {<path from -p>: {"before": md5, "after": md5, "updated": bool,
+#                                "edits": [[offset, old, new], ...]}}
+#   }
+#
+# Edits are byte offsets into the file as it was before, with the old and new
+# bytes written as latin-1 text so any byte survives json. Update edits are the
+# hex values replaced, patch edits the lines changed. Applying a manifest only
+# hashes each file to check it's the one the edits were made for, then splices
+# the edits in, nothing is scanned again. Files updated by the table are
+# recorded in the index against it once applied, like update does, so the
+# next update skips them rather than rewriting the new addresses again.
+
+import json
+from difflib import SequenceMatcher
+from hashlib import md5
+from common import (VERSION, BatchWriter, InvalidChangesError, get_full_path, manifest_key,
+                    read_ahead, read_file, record_index_entry, warning_msg)
+
+FORMAT_VERSION = 1
+
+
+def encode_bytes(data):
+    return data.decode('latin-1')
+
+
+def decode_bytes(text):
+    return text.encode('latin-1')
+
+
+def line_edits(old_data, new_data):
+    # Edits turning old_data into new_data, by changed runs of lines
+    old_lines = old_data.splitlines(keepends=True)
+    new_lines = new_data.splitlines(keepends=True)
+
+    offsets = [0]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    edits = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag != 'equal':
+            edits.append((offsets[i1], b''.join(old_lines[i1:i2]), b''.join(new_lines[j1:j2])))
+
+    return edits
+
+
+def splice(data, edits):
+    # Returns data with the edits applied, or None if the bytes at an edit don't match
+    parts = []
+    last = 0
+
+    for offset, old, new in sorted(edits, key=lambda edit: edit[0]):
+        if offset < last or data[offset:offset + len(old)] != old:
+            return None
+
+        parts.append(data[last:offset])
+        parts.append(new)
+        last = offset + len(old)
+
+    parts.append(data[last:])
+
+    return b''.join(parts)
+
+
+class ChangeManifest:
+
+    def __init__(self, root, mode, table=None, table_checksum=None):
+        self.root = root
+        self.mode = mode
+        self.table = table
+        self.table_checksum = table_checksum
+        self.files = {}
+
+    def record(self, file, old_data, new_data, edits=None, updated=False):
+        # Edits are worked out from the lines unless they're known, updated is
+        # whether the hex table changed the file
+        if edits is None:
+            edits = line_edits(old_data, new_data)
+
+        self.files[manifest_key(file, self.root)] = {
+            'before': md5(old_data).hexdigest(),
+            'after': md5(new_data).hexdigest(),
+            'updated': updated,
+            'edits': [[offset, encode_bytes(old), encode_bytes(new)] for offset, old, new in edits]
+        }
+
+    def edit_count(self):
+        return sum(len(entry['edits']) for entry in self.files.values())
+
+    def write(self, path):
+        with open(path, 'w') as file:
+            json.dump({'format': FORMAT_VERSION, 'version': VERSION, 'mode': self.mode,
+                       'table': self.table, 'table_checksum': self.table_checksum,
+                       'files': self.files}, file, sort_keys=True)
+
+
+def load_changes(path):
+    try:
+        with open(path, 'r') as file:
+            changes = json.load(file)
+
+        if changes['format'] != FORMAT_VERSION or not isinstance(changes['files'], dict):
+            raise ValueError
+
+        return changes
+    except (OSError, ValueError, KeyError, TypeError):
+        raise InvalidChangesError("Change manifest {} not found or invalid".format(path))
+
+
+def read_if_exists(file):
+    try:
+        return read_file(file)
+    except OSError:
+        return None
+
+
+def apply_changes(changes, root, backup, silent):
+    # Applies the edits of a change manifest, returns the files by what was done
+    files = changes['files']
+    table = changes.get('table_checksum')
+    results = {'applied': [], 'already': [], 'mismatched': []}
+    paths = [get_full_path(root, key) for key in files]
+    # Files holding what the table changes them to once the batch is written
+    indexed = []
+
+    with BatchWriter(backup) as batch:
+        for (key, entry), (file_with_path, data) in zip(files.items(), read_ahead(paths, read_if_exists)):
+            checksum = md5(data).hexdigest() if data is not None else None
+
+            if checksum == entry['after']:
+                if not silent:
+                    warning_msg("{} already changed".format(key))
+                results['already'].append(file_with_path)
+                if entry.get('updated'):
+                    indexed.append(file_with_path)
+                continue
+
+            new_data = None
+            if checksum == entry['before']:
+                new_data = splice(data, [(offset, decode_bytes(old), decode_bytes(new))
+                                         for offset, old, new in entry['edits']])
+
+            if new_data is None or md5(new_data).hexdigest() != entry['after']:
+                warning_msg("{} isn't the file the changes were made for, left unchanged".format(key))
+                results['mismatched'].append(file_with_path)
+                continue
+
+            batch.stage(file_with_path, new_data)
+            results['applied'].append(file_with_path)
+            if entry.get('updated'):
+                indexed.append(file_with_path)
+
+    if table is not None:
+        for file_with_path in indexed:
+            record_index_entry(file_with_path, table=table)
+
+    return results
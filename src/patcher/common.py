@@ -0,0 +1,893 @@
+# Helpers and state shared by every mode of the patcher
+#
+# Only modules that are cheap to import are imported up front, anything heavier
+# is imported by the function using it so modes that don't need it start faster
+
+import mmap
+import os
+from _thread import allocate_lock
+from collections import Counter
+from os import fdopen, path as ospath
+from time import perf_counter
+
+
+VERSION = "0.2.7"
+
+# Files are hashed in blocks of this size so memory stays flat
+CHUNK_SIZE = 1024 * 1024
+
+# Files read ahead by read_ahead() while the current one is processed
+READ_AHEAD = 4
+
+# Checksums generated during this run, keyed by (path, size, mtime, algorithm)
+_checksum_cache = {}
+
+# Persistent stat/hash index kept next to the md5 folder, loaded by main()
+INDEX_FILENAME = 'file_index.json'
+_file_index = None
+
+# Journals of the batches being written, kept next to the md5 folder so a run
+# killed while swapping files is rolled back or finished by the next one
+JOURNAL_DIR = 'journal'
+
+# Read once by default_file_mode(), it can only be read by setting it
+_umask = None
+
+
+class PatcherError(Exception):
+    # Base of the errors the patcher raises, the command line prints them and exits
+    pass
+
+
+class MissingChecksumsError(PatcherError):
+    pass
+
+
+class InvalidManifestError(PatcherError):
+    pass
+
+
+class InvalidChangesError(PatcherError):
+    pass
+
+
+class InvalidTableError(PatcherError):
+    pass
+
+
+class InvalidSpecError(PatcherError):
+    pass
+
+
+class FileAccessError(PatcherError):
+    # A file of the tree or an output couldn't be read or written
+    pass
+
+
+class StageTimer:
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.stats.add_time(self.stage, perf_counter() - self.start)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class Stats:
+    # Time per stage and counters, only collected when profiling is enabled.
+    # read_ahead() threads hash files too, so updates are locked and their
+    # stage times overlap, summed they can be more than the total
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = {}
+        self.counters = {}
+        self._null_timer = NullTimer()
+        # Same lock as threading.Lock, without importing threading at startup
+        self._lock = allocate_lock()
+
+    def timer(self, stage):
+        if not self.enabled:
+            return self._null_timer
+
+        return StageTimer(self, stage)
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            timing = self.timings.setdefault(stage, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += calls
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        # Returns and clears what was collected, used to send worker stats back
+        with self._lock:
+            data = {'timings': self.timings, 'counters': self.counters}
+            self.timings = {}
+            self.counters = {}
+
+        return data
+
+    def merge(self, data):
+        for stage, (seconds, calls) in data['timings'].items():
+            self.add_time(stage, seconds, calls)
+
+        for name, amount in data['counters'].items():
+            self.count(name, amount)
+
+    def to_dict(self, total_seconds=None):
+        return {
+            'version': VERSION,
+            'total_seconds': total_seconds,
+            'stages': {stage: {'seconds': seconds, 'calls': calls}
+                       for stage, (seconds, calls) in self.timings.items()},
+            'counters': dict(self.counters)
+        }
+
+    def report(self, total_seconds):
+        lines = ['Profile ({0:.4f}s total)'.format(total_seconds)]
+
+        for stage, (seconds, calls) in sorted(self.timings.items(), key=lambda item: -item[1][0]):
+            lines.append('  {0:<20}{1:>10.4f}s {2:>8} calls'.format(stage, seconds, calls))
+
+        lines.append('  (stages run on read ahead threads overlap, they can add up to more than the total)')
+
+        if self.counters:
+            lines.append('Counters')
+            for name, amount in sorted(self.counters.items()):
+                lines.append('  {0:<20}{1:>10}'.format(name, amount))
+
+        return '\n'.join(lines)
+
+
+STATS = Stats()
+
+
+class MissReport:
+    # Hex values without a replacement, counted per (address, file) and reported once at the end
+
+    def __init__(self):
+        self.misses = Counter()
+
+    def add(self, hex_value, source=None):
+        self.misses[(hex_value, source)] += 1
+
+    def snapshot(self):
+        # Returns and clears the misses, used to send worker misses back
+        misses = self.misses
+        self.misses = Counter()
+
+        return misses
+
+    def merge(self, misses):
+        self.misses.update(misses)
+
+    def total(self):
+        return sum(self.misses.values())
+
+    def by_address(self):
+        addresses = Counter()
+        files = {}
+
+        for (hex_value, source), count in self.misses.items():
+            addresses[hex_value] += count
+            files.setdefault(hex_value, set()).add(source)
+
+        return addresses, files
+
+    def summary(self, limit=10):
+        addresses, files = self.by_address()
+        lines = ["No replacement found for {0} hex values ({1} unique), they were left in place. "
+                 "Be Sure to check you have the correct hex table for this version".format(
+                     self.total(), len(addresses))]
+
+        for hex_value, count in addresses.most_common(limit):
+            lines.append("  {0}: {1} times in {2} files".format(hex_value, count, len(files[hex_value])))
+
+        if len(addresses) > limit:
+            lines.append("  ... and {} more".format(len(addresses) - limit))
+
+        return '\n'.join(lines)
+
+    def write(self, path):
+        import json
+
+        report = [{'address': hex_value, 'file': source, 'count': count}
+                  for (hex_value, source), count in self.misses.most_common()]
+
+        with open(path, 'w') as file:
+            json.dump({'total': self.total(), 'misses': report}, file, indent=2)
+
+
+MISSES = MissReport()
+
+
+def warning_msg(msg):
+    print("\033[93m {}\033[00m\n".format(msg))
+
+
+def error_msg(msg):
+    print("\033[91m {}\033[00m\n".format(msg))
+
+
+def success_msg(msg):
+    print("\033[92m {}\033[00m\n".format(msg))
+
+
+def convert(list):
+    string = ''
+    for c in list:
+       string = string + chr(c)
+
+    return string
+
+
+def get_full_path(path, filename):
+    return ospath.join(path, ''.join(filename))
+
+
+def default_file_mode(path):
+    # mkstemp creates files only the owner can read, give them the mode open() would have
+    global _umask
+
+    if _umask is None:
+        _umask = os.umask(0)
+        os.umask(_umask)
+
+    os.chmod(path, 0o666 & ~_umask)
+
+
+def link_or_copy(src, dst):
+    # Hardlinks are free and keep the original inode, copy where they aren't supported
+    try:
+        os.link(src, dst)
+    except OSError:
+        from shutil import copy2
+        copy2(src, dst)
+
+
+class BatchWriter:
+    # Stages rewritten files next to their targets, so every rename stays on one
+    # filesystem, and swaps them in together. If anything fails before the commit
+    # finishes, every file already swapped is rolled back.
+    #
+    # Every staged file is written to a journal first, then the start and the end
+    # of the swap. If the process dies, recover_batches() on the next run removes
+    # what was staged and rolls the swap back, or finishes it if every file was
+    # already swapped. Batches staged in worker processes are journaled by the
+    # batch adopting them.
+
+    def __init__(self, backup=False, journal=True):
+        self.backup = backup
+        self.staged = []
+        self.journal = journal
+        self.journal_file = None
+        self.journal_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def stage(self, target, data):
+        import hashlib
+        from shutil import copymode
+        from tempfile import mkstemp
+
+        with STATS.timer('temp_write'):
+            directory, name = ospath.split(ospath.abspath(target))
+            fh, temp_path = mkstemp(dir=directory, prefix='.{}.'.format(name), suffix='.tmp')
+
+            # Journaled before anything is written to it
+            self.write_journal({'target': ospath.abspath(target), 'temp': temp_path})
+
+            try:
+                # Whole file in one write, only loops if the OS writes less
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fh, view):]
+            finally:
+                os.close(fh)
+
+            copymode(target, temp_path)
+
+        self.staged.append((target, temp_path, hashlib.md5(data).hexdigest()))
+
+    def adopt(self, staged):
+        # Files staged by another process
+        for target, temp_path, _ in staged:
+            self.write_journal({'target': ospath.abspath(target), 'temp': temp_path})
+
+        self.staged.extend(staged)
+
+    def write_journal(self, record, sync=False):
+        if not self.journal:
+            return
+
+        import json
+
+        if self.journal_file is None:
+            from tempfile import mkstemp
+
+            directory = get_full_path(ospath.abspath(os.path.dirname(__file__)), JOURNAL_DIR)
+            os.makedirs(directory, exist_ok=True)
+            fh, self.journal_path = mkstemp(dir=directory, suffix='.journal')
+            self.journal_file = fdopen(fh, 'w')
+            self.journal_file.write(json.dumps({'pid': os.getpid()}) + '\n')
+
+        self.journal_file.write(json.dumps(record) + '\n')
+        self.journal_file.flush()
+
+        if sync:
+            os.fsync(self.journal_file.fileno())
+
+    def close_journal(self):
+        if self.journal_file is None:
+            return
+
+        self.journal_file.close()
+        os.remove(self.journal_path)
+        self.journal_file = None
+        self.journal_path = None
+
+    def discard(self):
+        for _, temp_path, _ in self.staged:
+            # The original is still linked if the swap failed right after linking it
+            for path in (temp_path, '{}.orig'.format(temp_path)):
+                if ospath.exists(path):
+                    os.remove(path)
+
+        self.staged = []
+        self.close_journal()
+
+    def commit(self):
+        committed = []
+
+        if not self.staged:
+            self.close_journal()
+            return []
+
+        with STATS.timer('commit'):
+            self.write_journal({'swap': True, 'backup': self.backup}, sync=True)
+
+            try:
+                for target, temp_path, checksum in self.staged:
+                    # Keep the original around until every file is swapped
+                    original = '{}.orig'.format(temp_path)
+                    link_or_copy(target, original)
+                    os.replace(temp_path, target)
+                    committed.append((target, original, checksum))
+            except BaseException:
+                for target, original, _ in reversed(committed):
+                    os.replace(original, target)
+                self.discard()
+                raise
+
+            # Every file is in place, a run killed from here on is finished rather than rolled back
+            self.write_journal({'committed': True}, sync=True)
+
+            for target, original, checksum in committed:
+                if self.backup:
+                    os.replace(original, "{}.bak".format(target))
+                else:
+                    os.remove(original)
+
+                # Cache the checksum of what was written so it's never read back
+                cache_checksum(target, checksum)
+                record_index_entry(target, md5=checksum)
+                STATS.count('files_swapped')
+                print("Patched {0}".format(ospath.basename(target)))
+
+        self.staged = []
+        self.close_journal()
+
+        return [target for target, _, _ in committed]
+
+
+def process_alive(pid):
+    if os.name == 'nt':
+        import ctypes
+
+        # os.kill would end the process on windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x100000, False, pid)
+        if not handle:
+            return False
+        try:
+            return ctypes.windll.kernel32.WaitForSingleObject(handle, 0) == 0x102
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+
+    return True
+
+
+def recover_batches():
+    # Rolls back or finishes the batches of runs that died while writing files,
+    # returns the number of files restored and finished
+    import json
+
+    directory = get_full_path(ospath.abspath(os.path.dirname(__file__)), JOURNAL_DIR)
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.journal')]
+    except OSError:
+        return 0, 0
+
+    restored = 0
+    finished = 0
+
+    for name in names:
+        journal_path = get_full_path(directory, name)
+        entries = []
+        pid = None
+        swapping = committed = backup = False
+
+        try:
+            with open(journal_path, 'r') as file:
+                lines = file.readlines()
+        except OSError:
+            continue
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Cut short by the crash
+                break
+
+            if 'pid' in record:
+                pid = record['pid']
+            elif 'temp' in record:
+                entries.append((record['target'], record['temp']))
+            elif 'swap' in record:
+                swapping = True
+                backup = record['backup']
+            elif 'committed' in record:
+                committed = True
+
+        # Another run still writing its batch
+        if pid is not None and pid != os.getpid() and process_alive(pid):
+            continue
+
+        for target, temp_path in entries:
+            original = '{}.orig'.format(temp_path)
+
+            if ospath.exists(original):
+                if committed:
+                    # Only the originals were left to move or remove
+                    if backup:
+                        os.replace(original, "{}.bak".format(target))
+                    else:
+                        os.remove(original)
+                    finished += 1
+                elif swapping and not ospath.samefile(original, target):
+                    os.replace(original, target)
+                    restored += 1
+                else:
+                    # Linked but never swapped, the target is still the original
+                    os.remove(original)
+
+            if ospath.exists(temp_path):
+                os.remove(temp_path)
+
+        os.remove(journal_path)
+
+    return restored, finished
+
+
+class MappedFile:
+    # Read only memory map of a file, empty files can't be mapped so they give b''
+
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'rb')
+
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+        return self.map
+
+    def __exit__(self, *args):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+def read_file(file):
+    with open(file, 'rb') as f:
+        return f.read()
+
+
+def read_source(file):
+    # Content and checksum of a source file, read once
+    data = read_file(file)
+
+    return data, generate_checksum(file, True, data=data)
+
+
+def hash_file(file, algorithm='md5'):
+    import hashlib
+
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+
+    with STATS.timer('hashing'), open(file, 'rb') as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+            STATS.count('bytes_hashed', size)
+
+    STATS.count('files_hashed')
+
+    return digest.hexdigest()
+
+
+def generate_checksum(file, silent, algorithm='md5', data=None):
+    # Only hash the file if it changed since it was last hashed this run,
+    # data is the content of the file if it was already read
+    stat = os.stat(file)
+    key = (ospath.abspath(file), stat.st_size, stat.st_mtime_ns, algorithm)
+    checksum = _checksum_cache.get(key)
+
+    if checksum is not None:
+        STATS.count('checksum_cache_hits')
+    elif algorithm == 'md5':
+        # Fall back to the checksum stored by a previous run
+        entry = get_index_entry(file, stat)
+        if entry is not None:
+            checksum = entry.get('md5')
+            if checksum is not None:
+                STATS.count('checksum_index_hits')
+
+    if checksum is None:
+        if data is None:
+            checksum = hash_file(file, algorithm)
+        else:
+            import hashlib
+
+            with STATS.timer('hashing'):
+                checksum = hashlib.new(algorithm, data).hexdigest()
+            STATS.count('bytes_hashed', len(data))
+            STATS.count('files_hashed')
+
+        if algorithm == 'md5':
+            record_index_entry(file, md5=checksum)
+
+    _checksum_cache[key] = checksum
+
+    if checksum and not silent:
+        print('Checksum generated for: {0}'.format(file))
+
+    return checksum
+
+
+def cache_checksum(file, checksum, algorithm='md5'):
+    stat = os.stat(file)
+    _checksum_cache[(ospath.abspath(file), stat.st_size, stat.st_mtime_ns, algorithm)] = checksum
+
+
+def get_index_path():
+    return get_full_path(ospath.abspath(os.path.dirname(__file__)), INDEX_FILENAME)
+
+
+def load_file_index():
+    import json
+
+    global _file_index
+    _file_index = {}
+
+    try:
+        with open(get_index_path(), 'r') as file:
+            _file_index = json.load(file).get('files', {})
+    except (OSError, ValueError, AttributeError):
+        # Missing or corrupt index, start a new one
+        _file_index = {}
+
+    return _file_index
+
+
+def save_file_index():
+    if _file_index is None:
+        return
+
+    import json
+    from tempfile import mkstemp
+
+    index_path = get_index_path()
+    fh, abs_path = mkstemp(dir=ospath.dirname(index_path))
+    with fdopen(fh, 'w') as file:
+        json.dump({'version': 1, 'files': _file_index}, file)
+
+    default_file_mode(abs_path)
+    os.replace(abs_path, index_path)
+
+
+def get_index_entry(file, stat=None):
+    # Returns the stored entry if the file hasn't changed since it was recorded
+    if _file_index is None:
+        return None
+
+    entry = _file_index.get(ospath.abspath(file))
+    if entry is None:
+        return None
+
+    if stat is None:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+
+    if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+        return None
+
+    return entry
+
+
+def record_index_entry(file, **fields):
+    if _file_index is None:
+        return
+
+    stat = os.stat(file)
+    entry = get_index_entry(file, stat)
+
+    # Anything recorded for an older version of the file no longer applies
+    if entry is None:
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                 'md5': None, 'patched': False, 'table': None}
+        _file_index[ospath.abspath(file)] = entry
+
+    entry.update(fields)
+
+
+def get_md5_folder_path():
+    return get_full_path(ospath.abspath(os.path.dirname(__file__)), 'md5')
+
+
+def manifest_key(file, root=''):
+    # Path of the file from the SFSE folder, always with / so manifests work on every OS
+    return ospath.relpath(file, root or '.').replace(os.sep, '/')
+
+
+def generate_checksum_file(files, filename, silent, root=''):
+    import json
+
+    md5FolderPath = get_md5_folder_path()
+
+    generated_checksums = []
+    for file, checksum in read_ahead(files, lambda file: generate_checksum(file, True)):
+        generated_checksums.append(checksum)
+
+        if not silent:
+            print('Checksum generated for: {0}'.format(file))
+
+    # Check checksum folder exists
+    md5FolderExists = ospath.exists(md5FolderPath)
+
+    if not md5FolderExists:
+        os.mkdir(md5FolderPath)
+
+    # Next to patched.md5, where getPatchedChecksums() and load_manifest() look for them
+    with open(get_full_path(md5FolderPath, '{}.md5'.format(filename)), 'w') as md5_file:
+        for checksum in generated_checksums:
+            md5_file.write('{}\n'.format(checksum))
+
+    # Manifest of the expected checksum of each file, for this version only
+    manifest = {manifest_key(file, root): checksum for file, checksum in zip(files, generated_checksums)}
+    with open(get_full_path(md5FolderPath, '{}.json'.format(filename)), 'w') as manifest_file:
+        json.dump({'version': 1, 'files': manifest}, manifest_file, indent=2, sort_keys=True)
+
+
+# Checksums of every patched file, loaded once per process by getPatchedChecksums()
+_patched_checksums = None
+
+
+def getPatchedChecksums(silent=False):
+    global _patched_checksums
+
+    if _patched_checksums is not None:
+        return _patched_checksums
+
+    errMsg = "md5 folder not found in script directory!, re-download folder from repo to continue."
+
+    # check that md5 files exists
+    md5FolderPath = get_md5_folder_path()
+
+    if ospath.exists(md5FolderPath):
+        if not silent:
+            print("md5 folder found, looking for md5 file...")
+    else:
+        raise MissingChecksumsError(errMsg)
+
+    md5FileExists = ospath.exists(get_full_path(md5FolderPath, 'patched.md5'))
+
+    if md5FileExists:
+        if not silent:
+            print("md5 file found, comparing hashes!")
+    else:
+        raise MissingChecksumsError(errMsg)
+
+    # add all patched checksum into a set for constant time lookup
+    with open(get_full_path(md5FolderPath, 'patched.md5'), 'r') as file:
+        _patched_checksums = frozenset(line.strip() for line in file if line.strip())
+
+    return _patched_checksums
+
+
+def load_manifest(path):
+    import json
+
+    # Manifests can be given by path or by the name they have in the md5 folder
+    if not ospath.exists(path):
+        path = get_full_path(get_md5_folder_path(), '{}.json'.format(path))
+
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)['files']
+    except (OSError, ValueError, KeyError, TypeError):
+        raise InvalidManifestError("Manifest {} not found or invalid".format(path))
+
+
+def verify_files(files, manifest=None, root='', patched_checksums=None):
+    # Yields each file and whether its checksum is a patched one. Files are hashed
+    # one after the other, a thread pool costs more to import than the few files
+    # verified take to hash, and most come from the index anyway
+    if manifest is None and patched_checksums is None:
+        patched_checksums = getPatchedChecksums()
+
+    for file in files:
+        checksum = generate_checksum(file, True)
+        if manifest is None:
+            yield file, checksum in patched_checksums
+        else:
+            # Exact checksum expected for this file in this version
+            yield file, manifest.get(manifest_key(file, root)) == checksum
+
+
+def verifyMd5(files, silent, manifest=None, root=''):
+    print("Verifying Checksums!")
+
+    match_count = 0
+    # Iterate over files and verify md5 hash
+    for file, isValid in verify_files(files, manifest, root):
+        if isValid:
+            match_count += 1
+
+        if not silent:
+            if isValid:
+                success_msg('{}: md5 Match!'.format(ospath.basename(file)))
+            else:
+                error_msg('{}: md5 Mismatch!'.format(ospath.basename(file)))
+
+    if match_count == len(files):
+        success_msg('All files matched!')
+    else:
+        error_msg(
+            'Some or all files failed to patch correctly! {0}/{1} '.format(match_count, len(files)))
+
+
+def scan_files(directory, extensions):
+    # One pass over the directory, entries are bucketed by extension in the order
+    # the OS lists them. Hidden files are skipped, like glob does
+    buckets = {extension: [] for extension in extensions}
+
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+
+                extension = ospath.normcase(ospath.splitext(entry.name)[1])
+                if extension in buckets and entry.is_file():
+                    buckets[extension].append(entry.name)
+    except OSError:
+        # Missing folder, nothing to grab
+        pass
+
+    return buckets
+
+
+def get_files(path, include_all=False, types=('*.cpp', '*.inl', '*.h')):
+    # Grab files for the directory, should be identical for both
+    files_grabbed = []
+    patched_dirs = ['sfse', 'sfse_loader']
+    extensions = [ospath.normcase(type.lstrip('*')) for type in types]
+
+    with STATS.timer('file_discovery'):
+        if include_all:
+            # Grab the patched files and include them, grouped by type then folder
+            buckets = [(directory, scan_files(get_full_path(path, directory), extensions))
+                       for directory in patched_dirs]
+
+            for extension in extensions:
+                for directory, files in buckets:
+                    files_grabbed.extend(get_full_path(ospath.join(path, directory), name)
+                                         for name in files[extension])
+        else:
+            # Only the names, the path is added later for scraping the hex values
+            buckets = scan_files(path or '.', extensions)
+
+            for extension in extensions:
+                files_grabbed.extend(buckets[extension])
+
+    STATS.count('files_found', len(files_grabbed))
+
+    return files_grabbed
+
+
+def read_ahead(items, load, workers=READ_AHEAD):
+    # Yields (item, load(item)) in order while the next items are loaded by a
+    # thread pool, so reading and hashing overlap with whatever the caller does
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            pending.append((item, executor.submit(load, item)))
+
+            if len(pending) > workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def get_dict(path):
+    import json
+    from binary_table import BinaryHexTable, is_binary_table
+
+    with STATS.timer('dictionary_load'):
+        try:
+            # Binary tables are memory mapped rather than parsed
+            if is_binary_table(path):
+                hex_dict = BinaryHexTable(path)
+            else:
+                # convert json dump to dict
+                with open(r'{}'.format(path), 'r') as file:
+                    lines = file.read()
+                    hex_dict = json.loads(lines)
+        except (OSError, ValueError):
+            raise InvalidTableError("Hex table {} not found or not a table".format(path))
+
+        if not is_binary_table(path) and not isinstance(hex_dict, dict):
+            raise InvalidTableError("Hex table {} not found or not a table".format(path))
+
+    STATS.count('dictionary_entries', len(hex_dict))
+
+    return hex_dict
@@ -0,0 +1,160 @@
+# Generate mode, pairs the hex values of two SFSE trees into a hex table
+
+import json
+import os
+import re
+import sys
+from os import fdopen, path as ospath
+from tempfile import mkstemp
+from align import AlignmentReport, align
+from common import (STATS, default_file_mode, get_dict, get_files, get_full_path, read_ahead,
+                    read_file)
+
+# Lines holding a hex address, and the first address of the line
+HEX_LINE_PATTERN = re.compile(rb'^[^\r\n]*?(0[xX][0-9a-fA-F]{7,})[^\r\n]*', re.MULTILINE)
+HEX_PATTERN = re.compile(rb'0[xX][0-9a-fA-F]{7,}')
+
+
+def scrape_hex_lines(data):
+    # (line number, key, first hex value) of each line holding a hex value, the key
+    # is the line with its hex values masked so it's the same in both versions
+    lines = []
+    line_no = 1
+    last = 0
+
+    for match in HEX_LINE_PATTERN.finditer(data):
+        line_no += data.count(b'\n', last, match.start())
+        last = match.start()
+        lines.append((line_no, HEX_PATTERN.sub(b'0x', match.group(0)).strip(), match.group(1).decode('ascii')))
+
+    return lines
+
+
+def write_hex_table(pairs, filename):
+    # Write the table as the pairs come in, the file is only moved into place
+    # once every pair was written so a failed run leaves nothing behind
+    written = {}
+    first = True
+
+    fh, abs_path = mkstemp(dir=ospath.dirname(ospath.abspath(filename)))
+    try:
+        with fdopen(fh, 'w') as f:
+            f.write('{')
+
+            for old_hex, new_hex in pairs:
+                # Identical duplicates are skipped, conflicting ones are written
+                # again so the last value wins when loaded, like a dict would
+                if written.get(old_hex) == new_hex:
+                    continue
+                written[old_hex] = new_hex
+
+                f.write('{0}{1}: {2}'.format('' if first else ', ',
+                                             json.dumps(old_hex), json.dumps(new_hex)))
+                first = False
+
+            f.write('}')
+
+        default_file_mode(abs_path)
+        os.replace(abs_path, filename)
+    finally:
+        if ospath.exists(abs_path):
+            os.remove(abs_path)
+
+    return len(written)
+
+
+def align_hex_values(file, old_data, new_data, report):
+    # Pairs the hex values of the two versions of a file line by line, lines
+    # added or removed between them are left out and reported
+    old_lines = scrape_hex_lines(old_data)
+    new_lines = scrape_hex_lines(new_data) if new_data is not None else []
+
+    pairs, unaligned = align([key for _, key, _ in old_lines], [key for _, key, _ in new_lines])
+
+    for old_lo, old_hi, new_lo, new_hi in unaligned:
+        report.add_unaligned(file, [[line_no, hex_value] for line_no, _, hex_value in old_lines[old_lo:old_hi]],
+                             [[line_no, hex_value] for line_no, _, hex_value in new_lines[new_lo:new_hi]])
+
+    return report.track(((old_lines[old_idx][2], new_lines[new_idx][2]) for old_idx, new_idx in pairs))
+
+
+def read_versions(files):
+    # Both versions of a file, None if it was removed from the new tree
+    old_file, new_file = files
+    new_data = read_file(new_file) if ospath.exists(new_file) else None
+
+    return read_file(old_file), new_data
+
+
+def generate_hex_pairs(files_grabbed, path1, path2, report):
+    # iterate over the files and align their hex values one file after another,
+    # the next files are read while the current one is aligned
+    files = [(get_full_path(path1, file), get_full_path(path2, file)) for file in files_grabbed]
+
+    for file, (_, (old_data, new_data)) in zip(files_grabbed, read_ahead(files, read_versions)):
+        yield from align_hex_values(file, old_data, new_data, report)
+
+
+def generate_hex_dict_for_dir(path1, path2, filename, silent, report=None):
+    # Lines that couldn't be aligned and conflicting addresses are collected in report
+    if report is None:
+        report = AlignmentReport()
+
+    files_grabbed = get_files(path1)
+
+    # Write file to working dir as the values are paired
+    with STATS.timer('generate'):
+        entries = write_hex_table(generate_hex_pairs(files_grabbed, path1, path2, report), filename)
+
+    return files_grabbed, entries
+
+
+def read_changed_files(changed):
+    # Paths from a list of files (e.g. git diff --name-only) or a unified diff, - reads stdin
+    paths = []
+    is_diff = None
+
+    file = sys.stdin if changed == '-' else open(changed, 'r')
+    try:
+        for line in file:
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                continue
+
+            if is_diff is None:
+                is_diff = line.startswith(('diff ', '--- ', 'Index: '))
+
+            if not is_diff:
+                paths.append(line.strip())
+            elif line.startswith(('--- ', '+++ ')):
+                changed_path = line[4:].split('\t')[0]
+                if changed_path == '/dev/null':
+                    continue
+                if changed_path.startswith(('a/', 'b/')):
+                    changed_path = changed_path[2:]
+                paths.append(changed_path)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    return paths
+
+
+def generate_hex_dict_incremental(path1, path2, filename, silent, base_table, changed, report=None):
+    # Only scrape the files that changed, their pairs replace the ones in the base table
+    if report is None:
+        report = AlignmentReport()
+
+    changed_names = set(ospath.basename(changed_path) for changed_path in read_changed_files(changed))
+    files_grabbed = [file for file in get_files(path1) if file in changed_names]
+
+    with STATS.timer('generate'):
+        hex_dict = dict(get_dict(base_table).items())
+
+        for file in files_grabbed:
+            old_data, new_data = read_versions((get_full_path(path1, file), get_full_path(path2, file)))
+            hex_dict.update(align_hex_values(file, old_data, new_data, report))
+
+        write_hex_table(hex_dict.items(), filename)
+
+    return files_grabbed
@@ -0,0 +1,93 @@
+# Matcher built once from the keys of a hex table, it only finds the addresses
+# that are in the table and looks them up case insensitively
+#
+# Every key is '0x' followed by hex digits and has to be matched as a whole token,
+# so matching boils down to a scan for tokens of the widths used by the table
+# followed by a hash lookup of the normalised digits. Both run inside the re engine
+# and a dict, which keeps throughput flat however many entries the table has.
+# The built matcher is cached next to the table so later runs skip building it.
+
+import hashlib
+import marshal
+import re
+from os import path as ospath
+
+CACHE_EXTENSION = '.matcher'
+CACHE_VERSION = 1
+
+
+def normalise(hex_str):
+    return hex_str[2:].upper()
+
+
+def build_pattern(widths):
+    # A key never matches the start of a longer address
+    alternatives = '|'.join('[0-9a-fA-F]{{{}}}'.format(width) for width in sorted(widths, reverse=True))
+
+    return r'0[xX](?:{})(?![0-9a-fA-F])'.format(alternatives)
+
+
+def table_digest(table_path):
+    digest = hashlib.md5()
+
+    with open(table_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class HexMatcher:
+
+    def __init__(self, pattern, lookup):
+        self.pattern = re.compile(pattern)
+        self.bytes_pattern = re.compile(pattern.encode('ascii'))
+        self.lookup = lookup
+
+    @classmethod
+    def from_table(cls, dictionary):
+        lookup = {}
+        widths = set()
+
+        for key, value in dictionary.items():
+            digits = normalise(key)
+            # The first entry wins if keys only differ by case
+            lookup.setdefault(digits, value)
+            widths.add(len(digits))
+
+        return cls(build_pattern(widths), lookup)
+
+    def get(self, hex_str):
+        # Replacement for a matched address, or None
+        return self.lookup.get(normalise(hex_str))
+
+    def save(self, path, digest):
+        with open(path, 'wb') as file:
+            file.write(marshal.dumps((CACHE_VERSION, digest, self.pattern.pattern, self.lookup)))
+
+
+def load_matcher(table_path, dictionary):
+    # Reuses the matcher cached next to the table if it was built from the same table
+    cache_path = '{}{}'.format(table_path, CACHE_EXTENSION)
+    digest = table_digest(table_path)
+
+    if ospath.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as file:
+                version, cached_digest, pattern, lookup = marshal.loads(file.read())
+
+            if version == CACHE_VERSION and cached_digest == digest:
+                return HexMatcher(pattern, lookup)
+        except (OSError, EOFError, ValueError, TypeError):
+            # Corrupt cache, build it again
+            pass
+
+    matcher = HexMatcher.from_table(dictionary)
+
+    try:
+        matcher.save(cache_path, digest)
+    except OSError:
+        # Read only table folder, just don't cache it
+        pass
+
+    return matcher
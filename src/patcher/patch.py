@@ -0,0 +1,78 @@
+# Patch mode, edits the loader so it runs on the game version being patched.
+# What's edited is described by the specs in the patch_specs folder
+
+from os import getcwd, path as ospath
+from common import (BatchWriter, get_full_path, get_index_entry, read_file,
+                    record_index_entry, warning_msg)
+from patch_spec import PATCHED, UNKNOWN, UNPATCHED, load_specs, patch_lines
+
+
+def get_patch_targets(path, specs=None):
+    # (filename, path, file specs) of every file a spec edits, in folder order
+    if specs is None:
+        specs = load_specs()
+
+    if path == '':
+        path = getcwd()
+
+    file_specs = {}
+    for spec in specs:
+        for directory in spec['dirs']:
+            for file_spec in spec['files']:
+                path_to_file = get_full_path(ospath.join(path, directory), file_spec.name)
+                file_specs.setdefault(path_to_file, (file_spec.name, []))[1].append(file_spec)
+
+    targets = []
+    for path_to_file, (file, specs_for_file) in file_specs.items():
+        if ospath.exists(path_to_file):
+            targets.append((file, path_to_file, specs_for_file))
+
+    return targets
+
+
+def patch_data(file, data, file_specs, silent):
+    # Returns the state the file was in and its patched bytes
+    state, lines = patch_lines(data.splitlines(keepends=True), file_specs)
+
+    if not silent:
+        if state == PATCHED:
+            warning_msg("{} already patched".format(file))
+        elif state == UNKNOWN:
+            warning_msg("{} doesn't match any patch spec, left unchanged".format(file))
+
+    return state, b''.join(lines)
+
+
+def patch(path, silent, backup, specs=None, changes=None):
+    # Returns the files by the state they were in. With changes, the patched
+    # files are only recorded there and nothing is written
+    patched_files = []
+    results = {UNPATCHED: [], PATCHED: [], UNKNOWN: []}
+
+    with BatchWriter(backup) as batch:
+        for file, path_to_file, file_specs in get_patch_targets(path, specs):
+            entry = get_index_entry(path_to_file)
+            if entry is not None and entry['patched']:
+                if not silent:
+                    warning_msg("{} already patched".format(file))
+                results[PATCHED].append(path_to_file)
+                continue
+
+            original = read_file(path_to_file)
+            state, data = patch_data(file, original, file_specs, silent)
+            results[state].append(path_to_file)
+
+            if changes is not None:
+                if state == UNPATCHED:
+                    changes.record(path_to_file, original, data)
+                continue
+
+            if state == UNPATCHED:
+                batch.stage(path_to_file, data)
+            if state != UNKNOWN:
+                patched_files.append(path_to_file)
+
+    for path_to_file in patched_files:
+        record_index_entry(path_to_file, patched=True)
+
+    return results
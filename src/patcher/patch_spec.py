@@ -0,0 +1,302 @@
+# Declarative patch specs, the edits patch mode makes to each file
+#
+# A spec is a json file in the patch_specs folder:
+#   {
+#     "format": 1,
+#     "name": "...",
+#     "dirs": [<folder>, ...],
+#     "files": [{"name": <filename>, "lines": <line count>, "edits": [<edit>, ...]}, ...]
+#   }
+#
+# Strings can be given as text or as a list of character codes. Every edit
+# points at lines of the unpatched file (0 based) and is one of:
+#   comment:          {"op": "comment", "line": n, "count": 1}, prefixes the lines with //
+#   replace:          {"op": "replace", "line": n, "old": ..., "new": ...}, in place
+#   insert_replaced:  {"op": "insert_replaced", "line": n, "old": ..., "new": ...},
+#                     inserts a copy of the line with old replaced by new after it
+#
+# Anchors decide if an edit applies: the lines have to exist, commented lines
+# can't already be commented and old has to be in the line. An edit can also
+# pin its lines with "hash", the md5 of the lines from n - "context" to
+# n + count + "context" with their line endings stripped and joined by \n.
+# "lines", if given, is the exact number of lines of the unpatched file, so a
+# file from another version doesn't get edited at the same indices.
+#
+# Running this module fills in the hash of every edit from an unpatched tree:
+#   patch_spec.py <spec> <path of the unpatched repo> [context]
+#
+# A file is already patched when undoing the edits gives back a file the anchors
+# match and patching that gives back the file as it is, so neither check relies
+# on the number of lines. Edits are applied and undone in one pass over the lines.
+
+import json
+import os
+import re
+from hashlib import md5
+from os import path as ospath
+from common import InvalidSpecError
+
+FORMAT_VERSION = 1
+SPEC_DIR = ospath.join(ospath.dirname(ospath.abspath(__file__)), 'patch_specs')
+OPS = ('comment', 'replace', 'insert_replaced')
+COMMENT = b'//'
+
+# States of a file against a spec
+UNPATCHED = 'unpatched'
+PATCHED = 'patched'
+UNKNOWN = 'unknown'
+
+
+def decode(value):
+    # Text or a list of character codes
+    if isinstance(value, list):
+        return ''.join(chr(c) for c in value)
+
+    return value
+
+
+def strip_line_ending(line):
+    return line.rstrip(b'\r\n')
+
+
+def lines_hash(lines, start, end):
+    return md5(b'\n'.join(strip_line_ending(line) for line in lines[start:end])).hexdigest()
+
+
+class FileSpec:
+    # Edits of one file, indexed by line so they're applied in a single pass
+
+    def __init__(self, name, edits, lines=None):
+        if lines is not None and (not isinstance(lines, int) or lines < 1):
+            raise ValueError('Invalid line count for {0}: {1}'.format(name, lines))
+
+        self.name = name
+        self.lines = lines
+        self.edits = []
+        self.comment = set()
+        self.replace = {}
+        self.insert = {}
+
+        for edit in edits:
+            op = edit.get('op')
+            line = edit.get('line')
+            count = edit.get('count', 1)
+
+            if op not in OPS or not isinstance(line, int) or line < 0 or count < 1:
+                raise ValueError('Invalid edit for {0}: {1}'.format(name, edit))
+            if op != 'comment' and count != 1:
+                raise ValueError('Only comment edits can span lines in {}'.format(name))
+
+            parsed = {
+                'op': op,
+                'line': line,
+                'count': count,
+                'old': decode(edit.get('old', '')).encode(),
+                'new': decode(edit.get('new', '')).encode(),
+                'hash': edit.get('hash'),
+                'context': edit.get('context', 0)
+            }
+
+            if op != 'comment' and not parsed['old']:
+                raise ValueError('{0} edit of {1} needs old'.format(op, name))
+
+            for idx in range(line, line + count):
+                if idx in self.comment or idx in self.replace:
+                    raise ValueError('Line {0} of {1} is edited twice'.format(idx, name))
+
+            if op == 'comment':
+                self.comment.update(range(line, line + count))
+            elif op == 'replace':
+                self.replace[line] = parsed
+            elif line in self.insert:
+                raise ValueError('Two lines inserted after line {0} of {1}'.format(line, name))
+            else:
+                self.insert[line] = parsed
+
+            self.edits.append(parsed)
+
+        self.last_line = max(edit['line'] + edit['count'] - 1 for edit in self.edits) if self.edits else -1
+
+    def anchors_match(self, lines):
+        # Checks the unpatched lines are the ones the edits were written for
+        if self.last_line >= len(lines):
+            return False
+        if self.lines is not None and len(lines) != self.lines:
+            return False
+
+        for edit in self.edits:
+            start = edit['line']
+            end = start + edit['count']
+
+            if edit['op'] == 'comment':
+                if any(lines[idx].startswith(COMMENT) for idx in range(start, end)):
+                    return False
+            elif edit['old'] not in lines[start]:
+                return False
+
+            if edit['hash'] is not None:
+                context = edit['context']
+                if start - context < 0 or end + context > len(lines):
+                    return False
+                if lines_hash(lines, start - context, end + context) != edit['hash']:
+                    return False
+
+        return True
+
+    def apply(self, lines):
+        patched = []
+
+        for idx, line in enumerate(lines):
+            original = line
+
+            if idx in self.comment:
+                line = COMMENT + line
+            elif idx in self.replace:
+                edit = self.replace[idx]
+                line = line.replace(edit['old'], edit['new'])
+
+            patched.append(line)
+
+            if idx in self.insert:
+                edit = self.insert[idx]
+                patched.append(original.replace(edit['old'], edit['new']))
+
+        return patched
+
+    def revert(self, lines):
+        # The unpatched lines, or None if the edits can't be found
+        original = []
+        idx = 0
+        pos = 0
+
+        while pos < len(lines):
+            line = lines[pos]
+
+            if idx in self.comment:
+                if not line.startswith(COMMENT):
+                    return None
+                line = line[len(COMMENT):]
+            elif idx in self.replace:
+                edit = self.replace[idx]
+                line = line.replace(edit['new'], edit['old'])
+
+            original.append(line)
+            pos += 1
+
+            if idx in self.insert:
+                # The inserted line is checked when the result is patched again
+                if pos >= len(lines):
+                    return None
+                pos += 1
+
+            idx += 1
+
+        return original
+
+    def state(self, lines):
+        # Checked for patched first so a file whose edits are all insertions isn't patched twice
+        original = self.revert(lines)
+        if original is not None and self.anchors_match(original) and self.apply(original) == lines:
+            return PATCHED
+
+        if self.anchors_match(lines):
+            return UNPATCHED
+
+        return UNKNOWN
+
+
+def load_spec(path):
+    try:
+        with open(path, 'r') as file:
+            spec = json.load(file)
+
+        if spec.get('format') != FORMAT_VERSION:
+            raise InvalidSpecError('{} is not a supported patch spec'.format(path))
+
+        return {
+            'name': spec.get('name', ospath.splitext(ospath.basename(path))[0]),
+            'dirs': [decode(directory) for directory in spec['dirs']],
+            'files': [FileSpec(decode(file['name']), file['edits'], file.get('lines')) for file in spec['files']]
+        }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+        raise InvalidSpecError('Patch spec {0} not found or invalid: {1}'.format(path, error))
+
+
+def load_specs(paths=None):
+    # Every spec in the patch_specs folder unless given, newest name first
+    if paths is None:
+        try:
+            names = sorted((name for name in os.listdir(SPEC_DIR) if name.endswith('.json')), reverse=True)
+        except OSError:
+            names = []
+
+        paths = [ospath.join(SPEC_DIR, name) for name in names]
+
+    return [load_spec(path) for path in paths]
+
+
+def patch_lines(lines, file_specs):
+    # Tries the specs of a file in order, returns the state the file was in and its patched lines
+    for file_spec in file_specs:
+        state = file_spec.state(lines)
+
+        if state == UNPATCHED:
+            return state, file_spec.apply(lines)
+        if state == PATCHED:
+            return state, lines
+
+    return UNKNOWN, lines
+
+
+def dump_spec(spec):
+    # Indented json, with the character code lists kept on one line
+    text = json.dumps(spec, indent=4)
+
+    return re.sub(r'\[\s*(\d+(?:,\s*\d+)*)\s*\]',
+                  lambda match: '[{}]'.format(', '.join(re.split(r',\s*', match.group(1)))), text) + '\n'
+
+
+def pin_spec(path, root, context=2):
+    # Sets the line count and the hash of every edit from the unpatched files under root,
+    # context is the number of lines around each edit that are hashed with it
+    with open(path, 'r') as file:
+        spec = json.load(file)
+
+    pinned = set()
+
+    for directory in spec['dirs']:
+        for idx, file_spec in enumerate(spec['files']):
+            # Pinned from the first folder holding the file
+            path_to_file = ospath.join(root, decode(directory), decode(file_spec['name']))
+            if idx in pinned or not ospath.exists(path_to_file):
+                continue
+            pinned.add(idx)
+
+            with open(path_to_file, 'rb') as file:
+                lines = file.read().splitlines(keepends=True)
+
+            if FileSpec(decode(file_spec['name']), file_spec['edits']).state(lines) != UNPATCHED:
+                raise ValueError('{} is not an unpatched file the spec applies to'.format(path_to_file))
+
+            file_spec['lines'] = len(lines)
+            for edit in file_spec['edits']:
+                start = edit['line']
+                end = start + edit.get('count', 1)
+                # As much context as the file has around the edit
+                edit_context = min(context, start, len(lines) - end)
+
+                edit['context'] = edit_context
+                edit['hash'] = lines_hash(lines, start - edit_context, end + edit_context)
+
+    with open(path, 'w') as file:
+        file.write(dump_spec(spec))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print('patch_spec.py <spec> <path of the unpatched repo> [context]')
+        sys.exit(1)
+
+    pin_spec(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 2)
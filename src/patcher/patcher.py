@@ -1,448 +1,216 @@
-from enum import Enum
-import hashlib
-import os
-import glob
-import json
-import sys
-import json
-import re
+# Entry point of the patcher, parses the options and runs the selected mode
+#
+# Each mode lives in its own module and is only imported once it's selected, so
+# printing the version or help doesn't pay for the imports of every mode
+
 import getopt
-from tempfile import mkstemp
-from shutil import move, copymode, copy
-from os import fdopen, getcwd, path as ospath
+import sys
+from enum import Enum
+from os import getcwd, path as ospath
+from time import perf_counter
+from common import (MISSES, STATS, VERSION, FileAccessError, InvalidTableError, PatcherError, convert,
+                    error_msg, generate_checksum, generate_checksum_file, get_dict, get_files,
+                    get_full_path, load_file_index, load_manifest, recover_batches, save_file_index,
+                    success_msg, verifyMd5, warning_msg)
+
+
+class MODE(str, Enum):
+    UPDATE = "update",
+    GENERATE = "generate",
+    PATCH = "patch",
+    MD5 = "md5",
+    CONVERT = "convert",
+    PIPELINE = "pipeline",
+    APPLY = "apply",
+    TABLE = "table"
+
+
+class MSG(str, Enum):
+    NO_PATH_HEX = "No paths provided for generating hex table",
+    NO_FILES_DICT = "No files to update, or dictionary not found",
+    EMPTY_PATH_WRONG_DIR = "Be sure to either run the script within the repo folder or point to the folder using [-p, --path] arguments",
+    NO_FILES_FOUND = "No Files found in provided path",
+    NO_MODE_SELECTED = "No mode selected, use -h, --help for usage",
+    NO_VERSION_COMMIT = "Game Version or CommitID not provided for output file",
+    INVALID_JOBS = "Number of jobs must be a positive number, or 0 to use every core",
+    INVALID_MATCHER = "Matcher must be either regex or table",
+    MISSES_TABLE_MATCHER = "The table matcher only finds the table's addresses, use --matcher regex for --misses",
+    NO_BASE_CHANGED = "Incremental generate needs both a base table [--base] and changed files [--changed]",
+    INVALID_CACHE_SIZE = "Cache size must be a positive number of MB",
+    NO_CHANGES = "No change manifest provided, use -f, --filename"
 
 
-def warning_msg(msg):
-    print("\033[93m {}\033[00m\n".format(msg))
+def exit_with_msg(msg):
+    error_msg(msg)
+    exit(0)
 
 
-def error_msg(msg):
-    print("\033[91m {}\033[00m\n".format(msg))
+def report_recovery():
+    # Undo or finish whatever a killed run left half written
+    restored, finished = recover_batches()
 
+    if restored or finished:
+        warning_msg("A previous run was interrupted while writing files, {0} files were restored "
+                    "and {1} finished".format(restored, finished))
 
-def success_msg(msg):
-    print("\033[92m {}\033[00m\n".format(msg))
 
+class Patcher:
+    # The patcher as a library, for running it on many trees from one process.
+    #
+    # The hex table (composed if several are given), its matcher, the patched
+    # checksums, the patch specs and the manifest are loaded once and reused by
+    # every call. Each call returns a dict of what happened, with what the command
+    # line would have printed under 'log', and raises a PatcherError instead of
+    # exiting. Output is captured through stdout, so calls shouldn't run on
+    # several threads at once. The file index and the result cache aren't used.
 
-def get_replacement_hex(hex_to_find, dictionary):
-    try:
-        new_hex = dictionary[hex_to_find]
-        return new_hex
-    except KeyError as e:
-        warning_msg(
-            "No replacement found for {}, leaving it in place. Be Sure to check you have the correct hex table for this version".format(e))
+    def __init__(self, tables=None, matcher='regex', specs=None, manifest=None, backup=False, jobs=1):
+        if matcher not in ('regex', 'table'):
+            raise PatcherError(MSG.INVALID_MATCHER.value)
+        if jobs < 0:
+            raise PatcherError(MSG.INVALID_JOBS.value)
 
+        from common import getPatchedChecksums
+        from patch_spec import load_specs
 
-def convert(list):
-    string = ''
-    for c in list:
-       string = string + chr(c)
+        if isinstance(tables, str):
+            tables = [tables]
 
-    return string
+        self.table_path = None
+        self.table = None
+        self.backup = backup
+        self.jobs = jobs
 
+        if tables:
+            from table_chain import compose_chain
 
-def get_full_path(path, filename):
-    return ospath.join(path, ''.join(filename))
+            try:
+                self.table_path = compose_chain(tables)
+                self.table = get_dict(self.table_path)
 
+                if matcher == 'table':
+                    from hex_matcher import load_matcher
 
-def move_file(old_file, new_file, backup, patched):
-    copymode(old_file, new_file)
+                    self.table = load_matcher(self.table_path, self.table)
+            except (OSError, ValueError) as error:
+                raise InvalidTableError("Hex tables {0} couldn't be loaded: {1}".format(', '.join(tables), error))
 
-    if backup and patched:
-        copy(old_file, "{}.bak".format(old_file))
+        report_recovery()
 
-    # Only replace if patched
-    if patched:
-        move(new_file, old_file)
-        print("Patched {0}".format(ospath.basename(old_file)))
+        self.patched_checksums = getPatchedChecksums(True)
+        self.specs = load_specs(specs or None)
+        self.manifest = load_manifest(manifest) if manifest else None
 
+    def check_tree(self, path):
+        if not ospath.isdir(path):
+            raise FileAccessError("{}: No such folder".format(path))
 
-def scrape_hex_values_from_file(file, silent):
-    hex_list = []
+    def run(self, action):
+        # Runs action with its output captured, returns its result and the output
+        from contextlib import redirect_stdout
+        from io import StringIO
 
-    # Read the lines of the files and create array for each
-    with open(r'{}'.format(file), 'r') as file:
-        for line in file.readlines():
-            # check if valid hex before appending
-            try:
-                regex = '(0[xX][0-9a-fA-F]{7,})'
-                pattern = re.findall(regex, line)
+        log = StringIO()
+        # Misses left over from a call that failed
+        MISSES.snapshot()
 
-                if len(pattern) >= 1:
-                    hex_list.append(pattern[0])
-            except ValueError:
-                if not silent:
-                    warning_msg(
-                        "Invalid hex, won't be added to the list: ", line)
-    return hex_list
+        try:
+            with redirect_stdout(log):
+                result = action()
+        except OSError as error:
+            raise FileAccessError("{0}: {1}".format(error.filename, error.strerror))
 
+        result['log'] = log.getvalue()
 
-def generate_checksum(file, silent):
-    checksum = hashlib.md5(open(file, 'rb').read()).hexdigest()
-    if checksum and not silent:
-        print('Checksum generated for: {0}'.format(file))
+        return result
 
-    return checksum
+    def update_tree(self, path):
+        # Updates the hex values of every source file under path
+        if self.table is None:
+            raise PatcherError(MSG.NO_PATH_HEX.value)
 
+        from update import ALREADY_PATCHED, UNCHANGED, UPDATED, update_files
 
-def generate_checksum_file(files, filename, silent):
-    md5FolderPath = get_full_path(ospath.abspath(
-        os.path.dirname(__file__)), 'md5')
+        self.check_tree(path)
 
-    generated_checksums = []
-    for file in files:
-        generated_checksums.append(generate_checksum(file, silent))
+        def action():
+            files = [get_full_path(path, file) for file in get_files(path)]
+            results = update_files(files, self.table, self.backup, self.jobs)
+            misses = MISSES.snapshot()
 
-    # Check checksum folder exists
-    md5FolderExists = ospath.exists(md5FolderPath)
+            return {
+                'updated': [file for file in files if results[file] == UPDATED],
+                'unchanged': [file for file in files if results[file] == UNCHANGED],
+                'already_patched': [file for file in files if results[file] == ALREADY_PATCHED],
+                'misses': [{'address': hex_value, 'file': source, 'count': count}
+                           for (hex_value, source), count in misses.most_common()]
+            }
 
-    if not md5FolderExists:
-        os.mkdir(md5FolderPath)
+        return self.run(action)
 
-    with open('md5/{}.md5'.format(filename), 'w') as md5_file:
-        for checksum in generated_checksums:
-            md5_file.write('{}\n'.format(checksum))
+    def patch_tree(self, path):
+        # Patches the loader of the SFSE repo at path, returns the files by the state they were in
+        from patch import patch
 
+        self.check_tree(path)
 
-def getPatchedChecksums(silent=False):
-    errMsg = "md5 folder not found in script directory!, re-download folder from repo to continue."
+        return self.run(lambda: patch(path, True, self.backup, self.specs))
 
-    # check that md5 files exists
-    md5FolderPath = get_full_path(ospath.abspath(
-        os.path.dirname(__file__)), 'md5')
+    def verify_tree(self, path):
+        # Checks every file under path against the manifest, or the patched checksums
+        from common import verify_files
 
-    if ospath.exists(md5FolderPath):
-        if not silent:
-            print("md5 folder found, looking for md5 file...")
-    else:
-        error_msg(errMsg)
-        sys.exit()
+        self.check_tree(path)
 
-    md5FileExists = ospath.exists(get_full_path(md5FolderPath, 'patched.md5'))
+        def action():
+            results = list(verify_files(get_files(path, True), self.manifest, path, self.patched_checksums))
 
-    if md5FileExists:
-        if not silent:
-            print("md5 file found, comparing hashes!")
-    else:
-        error_msg(errMsg)
-        sys.exit()
+            return {
+                'valid': [file for file, valid in results if valid],
+                'invalid': [file for file, valid in results if not valid]
+            }
 
-    patched_checksums = []
-    # add all patched checksum into list for easier lookup
-    with open(get_full_path(md5FolderPath, 'patched.md5'), 'r') as file:
-        patched_checksums = file.read().splitlines()
+        return self.run(action)
 
-    return patched_checksums
+    def check_table(self, path=None):
+        # Validates the table, with its coverage of the source files under path if given
+        if self.table_path is None:
+            raise PatcherError(MSG.NO_PATH_HEX.value)
 
+        from table_check import load_table_pairs, table_coverage, validate_table
 
-def verifyMd5(files, silent):
-    print("Verifying Checksums!")
+        pairs = load_table_pairs(self.table_path)
+        report = validate_table(pairs)
 
-    patched_checksums = getPatchedChecksums()
-    match_count = 0
-    # Iterate over files and verify md5 hash
-    for file in files:
-        checksum = generate_checksum(file, True)
-        isValid = checksum in patched_checksums
+        if path:
+            self.check_tree(path)
+            report['coverage'] = self.run(lambda: table_coverage(dict(pairs), path))
+            del report['coverage']['log']
 
-        if not silent:
-            if isValid:
-                match_count += 1
-                success_msg('{}: md5 Match!'.format(ospath.basename(file)))
-            else:
-                error_msg('{}: md5 Mismatch!'.format(ospath.basename(file)))
+        return report
 
-    if match_count == len(files):
-        success_msg('All files matched!')
-    else:
-        error_msg(
-            'Some or all files failed to patch correctly! {0}/{1} '.format(match_count, len(files)))
+    def generate_table(self, old_path, new_path, filename):
+        # Writes the hex table mapping the addresses under old_path to the ones under new_path
+        from align import AlignmentReport
+        from generate import generate_hex_dict_for_dir
 
-def create_combined_dictionary(lookup_file, value_file):
-    old_list = lookup_file
-    new_list = value_file
+        self.check_tree(old_path)
+        self.check_tree(new_path)
 
-    # compare list size and throw error if different
-    if len(old_list) != len(new_list):
-       error_msg('The two files do not have the same length of lines, please check')
-       sys.exit()
-    else:
-        #create the dictionary of hex values from files
-        dictionary = {"{}".format(old_list[i]): new_list[i] for i in range(len(old_list))}
-
-    return dictionary
-
-
-def update(file_with_path, dictionary, backup):
-    # Prevent patcher from running on the same file twice
-    # potentially changing new addresses
-    patched_checksums = getPatchedChecksums(True)
-    checksum = generate_checksum(file_with_path, True)
-
-    if checksum in patched_checksums:
-        print('{} already patched, skipping!'.format(
-            ospath.basename(file_with_path)))
-        return
-
-    regex = '(0[xX][0-9a-fA-F]{7,})'
-    patched = False
-
-    # Create temp file
-    fh, abs_path = mkstemp()
-    with fdopen(fh, 'r+') as new_file:
-        with open(file_with_path, "r+") as old_file:
-            for line in old_file:
-                # replace single hex value
-                pattern = re.findall(regex, line)
-
-                if len(pattern) == 1:
-                    old_hex = pattern[0]
-                    new_hex = get_replacement_hex(old_hex, dictionary)
-
-                    # if we find no hex leave the previous line
-                    if new_hex is None:
-                        new_file.write(line)
-                    else:
-                        new_file.write(line.replace(old_hex, new_hex))
-                        patched = True
-
-                elif len(pattern) > 1:
-                    # iterate through hex values and replace them
-                    new_line = line
-
-                    for hex_in_pattern in pattern:
-                        new_hex = get_replacement_hex(
-                            hex_in_pattern, dictionary)
-
-                        # no hex, leave it alone
-                        if new_hex is not None:
-                            new_line = new_line.replace(old_hex, new_hex)
-                            patched = True
-
-                    new_file.write(new_line)
-                else:
-                    # keep old line if nothing found
-                    new_file.write(line)
-
-    move_file(file_with_path, abs_path, backup, patched)
-
-
-def generate_hex_list_from_files(files_grabbed, path, silent):
-    full_hex_list = []
-
-    # iterate over the files and scrape the hex values into a single file
-    for file in files_grabbed:
-        full_hex_list = full_hex_list + scrape_hex_values_from_file(get_full_path(path, file), silent)
-    
-    return full_hex_list
-
-
-def get_files(path, include_all=False, types=('*.cpp', '*.inl', '*.h')):
-    # Grab files for the directory, should be identical for both
-    files_grabbed = []
-    types_to_include = []
-    patched_dirs = ['sfse', 'sfse_loader']
-
-    if include_all:
-        # Grab the patched files and include them
-        for type in types:
-            for directory in patched_dirs:
-                types_to_include.append('{0}\{1}'.format(directory, type))
-    else:
-        types_to_include = types
+        def action():
+            report = AlignmentReport()
+            files, entries = generate_hex_dict_for_dir(old_path, new_path, filename, True, report)
 
-    for file in types_to_include:
-        if not include_all:
-            # Strip path so we can add it later for scraping the hex values
-            files_grabbed.extend(ospath.basename(x) for x in glob.glob(
-                get_full_path(path, file)))
-        else:
-            files_grabbed.extend(glob.glob(
-                get_full_path(path, file), recursive=True))
-
-    return files_grabbed
-
-def get_dict(path):
-    hex_dict = {}
-
-    # convert json dump to dict
-    with open(r'{}'.format(path), 'r') as file:
-        lines = file.read()
-        hex_dict = json.loads(lines)
-
-    return hex_dict
-
-def generate_hex_dict_for_dir(path1, path2, filename, silent):
-    files_grabbed = get_files(path1)
-
-    # Generate array of hex values from the files
-    hex_list_old = generate_hex_list_from_files(files_grabbed, path1, silent)
-    hex_list_new = generate_hex_list_from_files(files_grabbed, path2, silent)
-
-
-    # Create the dict with both lists
-    combined_dict = create_combined_dictionary(hex_list_old, hex_list_new)
-
-    # Write file to working dir
-    with open(filename, "w") as f:
-        f.write(json.dumps(combined_dict))
-        f.close()
-
-def patch(path, silent, backup):
-    files_to_patch = [
-        # convert([ # No need to patch the address lib filename this release
-        #     80, 108, 117, 103,
-        #     105, 110, 77, 97,
-        #     110, 97, 103, 101,
-        #     114, 46, 99, 112, 112]),
-        convert([
-            73, 100, 101, 110, 116, 
-            105, 102, 121, 69, 88, 
-            69, 46, 99, 112, 112
-            ]),
-        convert([
-            109, 97, 105, 110, 
-            46, 99, 112, 112
-        ])
-    ]
-    dirs = [
-        convert([115, 102, 115, 101]), 
-        convert([
-            115, 102, 115, 101, 95,
-            108, 111, 97, 100, 101, 
-            114])
-    ]
-
-    if path == '':
-        path = getcwd()
-
-    for dir in dirs:
-        for file in files_to_patch:
-            path_to_file = get_full_path(ospath.join(path, dir), file)
-            if ospath.exists(path_to_file):
-                
-                fh, abs_path = mkstemp()
-                with fdopen(fh,'r+') as new_file:
-                    with open(path_to_file, "r+") as old_file:
-                        lines = old_file.readlines()
-                        line_count = len(lines)
-                        already_patched = False
-
-                        if file == files_to_patch[1]:
-                            # Check if already patched
-                            if line_count != 386:
-                                    already_patched = True
-                            else:
-                                for idx, line in enumerate(lines):
-                                    if idx == 117:
-                                        old_line = lines.pop(idx)
-                                        new_line = "//{}".format(old_line)
-                                        lines.insert(idx, new_line)
-
-                                    if idx == 346:
-                                        new_line = line.replace(
-                                            convert([83, 116, 101, 97, 109]), 
-                                            convert([
-                                                87, 105, 110, 83, 
-                                                116, 111, 114, 101
-                                            ])
-                                            )
-                                        lines.insert(347, new_line)
-
-                        if file == files_to_patch[0]:
-                            # Check if already patched
-                            if line_count != 487:
-                                if str(lines[326]).startswith('//'):
-                                    already_patched = True
-                            else:
-                                for idx, line in enumerate(lines):
-                                    if idx >= 325 and idx <= 329:
-                                        old_line = lines.pop(idx)
-                                        new_line = "//{}".format(old_line)
-                                        lines.insert(idx, new_line)
-
-                                    if idx == 366:
-                                        new_line = line.replace(
-                                            convert([83, 116, 101, 97, 109]), 
-                                            convert([
-                                                87, 105, 110, 83, 
-                                                116, 111, 114, 101
-                                            ])
-                                            )
-                                        lines.insert(367, new_line)
-
-                                    elif idx >= 379 and idx <= 384:
-                                        old_line = lines.pop(idx)
-                                        new_line = "//{}".format(old_line)
-                                        lines.insert(idx, new_line)
-
-                        # if file == files_to_patch[0]:
-                        #     # Check if already patched
-                        #     if str(lines[398]).startswith('//'):
-                        #         already_patched = True
-                        #     else:
-                        #         for idx, line in enumerate(lines):
-                        #             if idx == 398:
-                        #                 old_line = lines.pop(idx)
-                        #                 new_line = "//{}".format(old_line)
-                        #                 lines.insert(idx, new_line)
-
-                        #             if idx == 401:
-                        #                 old_line = lines.pop(idx)
-                        #                 new_line = line.replace(
-                        #                     convert([
-                        #                         45, 37, 100, 45,
-                        #                         37, 100, 45, 37,
-                        #                         100, 45, 37, 100,
-                        #                         37, 115
-                        #                         ]),
-                        #                     convert([
-                        #                         45, 37, 100, 45, 37,
-                        #                         100, 45, 37, 100, 45,
-                        #                         37, 100, 45, 37, 100
-                        #                     ])
-                        #                     )
-                        #                 lines.insert(idx, new_line)
-
-                        #             elif idx == 405:
-                        #                 old_line = lines.pop(idx)
-                        #                 new_line = line.replace(
-                        #                     convert([
-                        #                         98, 117, 105, 108, 100,
-                        #                         84, 121, 112, 101
-                        #                         ]),
-                        #                     convert([49])
-                        #                     )
-                        #                 lines.insert(idx, new_line)
-
-                        if not silent and already_patched:
-                            warning_msg("{} already patched".format(file))            
-
-                        new_file.writelines(lines)
-
-                move_file(path_to_file, abs_path, backup, True)
+            result = {'path': ospath.abspath(filename), 'entries': entries, 'files': files}
+            result.update(report.to_dict())
 
+            return result
+
+        return self.run(action)
 
-def exit_with_msg(msg):
-    error_msg(msg)
-    exit(0)
 
 def main(argv):
-    class MODE(str, Enum):
-        UPDATE = "update",
-        GENERATE = "generate",
-        PATCH = "patch",
-        MD5 = "md5"
-
-    class MSG(str, Enum):
-        NO_PATH_HEX = "No paths provided for generating hex table",
-        NO_FILES_DICT = "No files to update, or dictionary not found",
-        EMPTY_PATH_WRONG_DIR = "Be sure to either run the script within the repo folder or point to the folder using [-p, --path] arguments",
-        NO_FILES_FOUND = "No Files found in provided path",
-        NO_MODE_SELECTED = "No mode selected, use -h, --help for usage",
-        NO_VERSION_COMMIT = "Game Version or CommitID not provided for output file"
-
-    version = "0.2.7"
+    version = VERSION
 
     mode= ''
     path = ''
@@ -452,7 +220,25 @@ def main(argv):
     silent = False
     backup = False
     verify = False
-    filename = 'patched'
+    manifest_file = ''
+    spec_files = []
+    dict_files = []
+    filename = ''
+    jobs = 1
+    use_index = True
+    profile = False
+    stats_file = ''
+    misses_file = ''
+    matcher = 'regex'
+    base_table = ''
+    changed = ''
+    cache_dir = ''
+    cache_size = None
+    result_cache = None
+    dry_run = ''
+    changes = None
+    conflicts_file = ''
+    report_file = ''
 
     help_info = """
         hex_updater.py -m <mode> <options>
@@ -462,34 +248,86 @@ def main(argv):
             update: Updates hex values using a hex dictionary
             patch: Patches out the error message preventing program from running
             md5: Will generate a md5 checksum for the files to verify patch was successful
+            convert: Converts a json hex table into the compact binary format
+            pipeline: Runs update, patch and md5 --verify in a single pass
+            apply: Applies the changes recorded by a dry run
+            table: Validates a hex table, reports its coverage of a tree and exports it normalised
 
         <Options>
             -h, --help
             -m, --mode: Selects the mode to use
             -v, --version: script version number
             -s, --silent: hides output of commands
+            --no-index: Don't use the stat/hash index to skip files unchanged since the last run
+            --profile: Prints the time spent in each stage and counters once finished
+            --stats: Writes the profile as json to this file (enables --profile)
+            --dry-run: update, patch and pipeline only record what they would change to this
+                json file, with the offset, old and new bytes of each edit, and write nothing else
                 generate:
                     -p, --path: Path of the old hex values, will be used as a reference (use full path)
                     -n, --path2: Path of the new hex values, will become the value of the old key (use full path)
                     -g, --starfield: Starfield game version, will be used in the filename
                     -c, --commit: Truncated commit ID of SFSE, will be used in the filename
+                    --base: Existing hex table to update incrementally instead of scraping every file
+                    --changed: File listing the changed files (git diff --name-only) or a unified diff, - reads stdin
+                    --conflicts: Writes the lines that couldn't be aligned between the two versions of a
+                        file, and the addresses paired with several new addresses, to this json file
                 update:
                     -p, --path: Path to the folder of files to be updated, files will be backed up by default (use full path)
-                    -d, --dictfile: dictionary to be used for updating hex values (use full path)
+                    -d, --dictfile: dictionary to be used for updating hex values (use full path), repeat it
+                        to chain tables across several versions, oldest first. The chain is composed into one
+                        table, cached in a composed folder next to the first table
                     -b, --backup: Option to backup files
+                    -j, --jobs: Number of files to update in parallel, 0 uses every core (default 1)
+                    --misses: Writes every hex value without a replacement, per file, to this json file
+                    --matcher: regex (default) matches every hex value, table only matches the table's
+                        addresses (case insensitive) and caches itself next to the table, it can't
+                        report misses
+                    --cache: Folder to cache updated files in, keyed by file, hex table and script version
+                    --cache-size: Size limit of the cache in MB, least recently used files are removed (default 256)
                 patch:
                     -p, --path: Path to the folder of files to be patched, files will be backed up by default (use full path)
                     -b, --backup: Option to backup files
+                    --spec: Patch spec to use instead of every spec in the patch_specs folder, can be repeated
                 md5:
                     -p, --path: Path to the folder containing the files
-                    -f, --filename: Filename of the file generated
+                    -f, --filename: Filename of the file generated, a manifest of each file's checksum
+                        is written next to it as <filename>.json
                     --verify: Verify patch/update via md5 hash
+                    --manifest: Verify each file against its checksum in this manifest instead of
+                        every known checksum, a path or the name of a manifest in the md5 folder
+                pipeline:
+                    -p, --path: Path to the SFSE repo folder (use full path)
+                    -d, --dictfile: dictionary to be used for updating hex values (use full path), can be
+                        repeated to chain tables like update
+                    -b, --backup: Option to backup files
+                    --misses: Writes every hex value without a replacement, per file, to this json file
+                    --matcher: regex (default) or table, same as update
+                    --cache, --cache-size: Cache updated files, same as update
+                    --manifest: Verify against a manifest, same as md5
+                    --spec: Patch spec to use, same as patch
+                convert:
+                    -d, --dictfile: json hex table to convert (use full path)
+                    -f, --filename: Filename of the binary table, defaults to the json filename with a .bin extension
+                apply:
+                    -p, --path: Path the dry run was given, the files are found from it
+                    -f, --filename: Change manifest written by --dry-run
+                    -b, --backup: Option to backup files
+                table:
+                    -d, --dictfile: Hex table to check (use full path), json or binary
+                    -p, --path: Folder of source files to report the table's coverage of (optional)
+                    -f, --filename: Writes the table without invalid, duplicate or identity entries,
+                        sorted, to this file (binary for a .bin extension)
+                    --report: Writes the checks and statistics as json to this file
+                    Exits with 1 when the table has errors
     """
 
     #try:
-    opts, args = getopt.getopt(argv, "hvm:d:p:n:s:g:c:b:f:", [
+    opts, args = getopt.getopt(argv, "hvm:d:p:n:sg:c:bf:j:", [
                                "help", "mode=", "dictfile=", "path=", "path2=", "silent", "starfield=",
-                               "commit=", "version", "backup", "filename=", "verify"])
+                               "commit=", "version", "backup", "filename=", "verify", "manifest=", "spec=", "jobs=", "no-index",
+                               "profile", "stats=", "misses=", "matcher=",
+                               "base=", "changed=", "cache=", "cache-size=", "dry-run=", "conflicts=", "report="])
     for opt, arg in opts:
         if opt in ('-h', "--help"):
                 print(help_info)
@@ -498,6 +336,7 @@ def main(argv):
                 mode = arg
         elif opt in ("-d", "--dictfile"):
                 dict_file_name = arg
+                dict_files.append(arg)
         elif opt in ("-p", "--path"):
                 path = arg
         elif opt in ("-n", "--path2"):
@@ -512,13 +351,76 @@ def main(argv):
             filename = arg
         elif opt in ("--verify"):
             verify = True
+        elif opt == "--manifest":
+            manifest_file = arg
+        elif opt == "--spec":
+            spec_files.append(arg)
         elif opt in ("-b", "--backup"):
             backup = True
         elif opt in ("-s", "--silent"):
             silent = True
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                jobs = -1
+
+            if jobs < 0:
+                exit_with_msg(MSG.INVALID_JOBS.value)
+        elif opt == "--no-index":
+            use_index = False
+        elif opt == "--profile":
+            profile = True
+        elif opt == "--stats":
+            profile = True
+            stats_file = arg
+        elif opt == "--misses":
+            misses_file = arg
+        elif opt == "--matcher":
+            if arg not in ('regex', 'table'):
+                exit_with_msg(MSG.INVALID_MATCHER.value)
+            matcher = arg
+        elif opt == "--base":
+            base_table = arg
+        elif opt == "--changed":
+            changed = arg
+        elif opt == "--cache":
+            cache_dir = arg
+        elif opt == "--cache-size":
+            try:
+                cache_size = int(arg) * 1024 * 1024
+            except ValueError:
+                cache_size = 0
+
+            if cache_size <= 0:
+                exit_with_msg(MSG.INVALID_CACHE_SIZE.value)
+        elif opt == "--dry-run":
+            dry_run = arg
+        elif opt == "--conflicts":
+            conflicts_file = arg
+        elif opt == "--report":
+            report_file = arg
 
     print("Starfield Hex Updater - Patcher v{0}!".format(version))
 
+    if misses_file and matcher == 'table':
+        # Addresses that aren't in the table are never matched, so none are missed
+        warning_msg(MSG.MISSES_TABLE_MATCHER.value)
+
+    STATS.enabled = profile
+    start_time = perf_counter()
+
+    if use_index and mode in (MODE.UPDATE, MODE.PATCH, MODE.MD5, MODE.PIPELINE, MODE.APPLY):
+        load_file_index()
+
+    if mode in (MODE.UPDATE, MODE.PATCH, MODE.PIPELINE, MODE.APPLY):
+        report_recovery()
+
+    if dry_run and mode in (MODE.UPDATE, MODE.PATCH, MODE.PIPELINE):
+        from change_manifest import ChangeManifest
+
+        changes = ChangeManifest(path, mode)
+
     if mode == MODE.UPDATE:
         try:
             dict_file_name
@@ -528,6 +430,14 @@ def main(argv):
             if dict_file_name == '' or path == '':
                 exit_with_msg(MSG.NO_PATH_HEX.value)
 
+        from update import open_result_cache, update_files
+
+        if len(dict_files) > 1:
+            from table_chain import compose_chain
+
+            # Tables are applied in one pass once composed, rather than one run per table
+            dict_file_name = compose_chain(dict_files)
+
         # Get files to update
         files = get_files(path)
         hex_dict = get_dict(dict_file_name)
@@ -535,8 +445,31 @@ def main(argv):
         if len(files) == 0 or hex_dict is None:
             exit_with_msg(MSG.NO_FILES_DICT.value)
 
-        for file in files:
-            update(get_full_path(path, file), hex_dict, backup)
+        if matcher == 'table':
+            from hex_matcher import load_matcher
+
+            with STATS.timer('matcher_load'):
+                hex_dict = load_matcher(dict_file_name, hex_dict)
+
+        if changes is not None:
+            from update import dry_run_files
+
+            changes.table = ospath.basename(dict_file_name)
+            changes.table_checksum = generate_checksum(dict_file_name, True)
+            dry_run_files([get_full_path(path, file) for file in files], hex_dict, changes,
+                          changes.table_checksum)
+        else:
+            if cache_dir:
+                result_cache = open_result_cache(cache_dir, dict_file_name, matcher, cache_size)
+
+            update_files([get_full_path(path, file) for file in files], hex_dict,
+                         backup, jobs, generate_checksum(dict_file_name, True))
+
+        if MISSES.total():
+            warning_msg(MISSES.summary())
+
+        if misses_file:
+            MISSES.write(misses_file)
 
     elif mode == MODE.GENERATE:
         if path == '' or path2 == '':
@@ -545,8 +478,28 @@ def main(argv):
         if game_version == '' or commit == '':
             exit_with_msg(MSG.NO_VERSION_COMMIT.value)
 
+        from align import AlignmentReport
+        from generate import generate_hex_dict_for_dir, generate_hex_dict_incremental
+
         hex_file_name = "hex_table_{0}_{1}.json".format(game_version, commit)
-        generate_hex_dict_for_dir(path, path2, hex_file_name, silent)
+        report = AlignmentReport()
+
+        if base_table or changed:
+            if not base_table or not changed:
+                exit_with_msg(MSG.NO_BASE_CHANGED.value)
+
+            files_grabbed = generate_hex_dict_incremental(path, path2, hex_file_name, silent, base_table,
+                                                          changed, report)
+            success_msg("Regenerated {0} changed files on top of {1}".format(
+                len(files_grabbed), ospath.basename(base_table)))
+        else:
+            generate_hex_dict_for_dir(path, path2, hex_file_name, silent, report)
+
+        if report.total():
+            warning_msg(report.summary())
+
+        if conflicts_file:
+            report.write(conflicts_file)
 
     elif mode == MODE.PATCH:
         currDirName = ospath.basename(getcwd())
@@ -554,7 +507,11 @@ def main(argv):
             # Check if we're in the correct directory
             exit_with_msg(MSG.EMPTY_PATH_WRONG_DIR.value)
         
-        patch(path, silent, backup)
+        from patch import patch
+        from patch_spec import load_specs
+
+        with STATS.timer('patch'):
+            patch(path, silent, backup, load_specs(spec_files or None), changes)
 
     elif mode == MODE.MD5:
         currDirName = ospath.basename(getcwd())
@@ -566,12 +523,139 @@ def main(argv):
         if len(files) == 0:
             exit_with_msg(MSG.NO_FILES_DICT.value)
 
-        if verify:
-            verifyMd5(files, silent)
-        else:
-            generate_checksum_file(files, filename, silent)
+        with STATS.timer('verify' if verify else 'checksum_file'):
+            if verify:
+                manifest = load_manifest(manifest_file) if manifest_file else None
+                verifyMd5(files, silent, manifest, path)
+            else:
+                generate_checksum_file(files, filename or 'patched', silent, path)
+
+    elif mode == MODE.CONVERT:
+        try:
+            dict_file_name
+        except NameError:
+            exit_with_msg(MSG.NO_PATH_HEX.value)
+
+        from binary_table import convert_json_table
+
+        binary_file_name = convert_json_table(dict_file_name, filename or None)
+        success_msg("Binary hex table written to {}".format(binary_file_name))
+
+    elif mode == MODE.PIPELINE:
+        try:
+            dict_file_name
+        except NameError:
+            exit_with_msg(MSG.NO_PATH_HEX.value)
+
+        currDirName = ospath.basename(getcwd())
+        if path == '' and currDirName != convert([115, 102, 115, 101]):
+            # Check if we're in the correct directory
+            exit_with_msg(MSG.EMPTY_PATH_WRONG_DIR.value)
+
+        from pipeline import run_pipeline
+        from update import open_result_cache
+
+        if len(dict_files) > 1:
+            from table_chain import compose_chain
+
+            dict_file_name = compose_chain(dict_files)
+
+        hex_dict = get_dict(dict_file_name)
+        if hex_dict is None:
+            exit_with_msg(MSG.NO_FILES_DICT.value)
+
+        if matcher == 'table':
+            from hex_matcher import load_matcher
+
+            with STATS.timer('matcher_load'):
+                hex_dict = load_matcher(dict_file_name, hex_dict)
+
+        if cache_dir and changes is None:
+            result_cache = open_result_cache(cache_dir, dict_file_name, matcher, cache_size)
+
+        if changes is not None:
+            changes.table = ospath.basename(dict_file_name)
+            changes.table_checksum = generate_checksum(dict_file_name, True)
+
+        manifest = load_manifest(manifest_file) if manifest_file else None
+        from patch_spec import load_specs
+
+        if not run_pipeline(path, hex_dict, backup, silent, generate_checksum(dict_file_name, True), manifest,
+                            load_specs(spec_files or None), changes):
+            exit_with_msg(MSG.NO_FILES_DICT.value)
+
+        if misses_file:
+            MISSES.write(misses_file)
+    elif mode == MODE.APPLY:
+        if filename == '':
+            exit_with_msg(MSG.NO_CHANGES.value)
+
+        from change_manifest import apply_changes, load_changes
+
+        with STATS.timer('apply'):
+            results = apply_changes(load_changes(filename), path, backup, silent)
+
+        success_msg("Applied the changes to {0} files, {1} already changed, {2} left unchanged".format(
+            len(results['applied']), len(results['already']), len(results['mismatched'])))
+    elif mode == MODE.TABLE:
+        try:
+            dict_file_name
+        except NameError:
+            exit_with_msg(MSG.NO_PATH_HEX.value)
+
+        from table_check import export_table, format_report, load_table_pairs, table_coverage, validate_table
+
+        pairs = load_table_pairs(dict_file_name)
+
+        with STATS.timer('validate'):
+            report = validate_table(pairs)
+
+        if path:
+            with STATS.timer('coverage'):
+                report['coverage'] = table_coverage(dict(pairs), path)
+
+        print(format_report(report))
+
+        if report_file:
+            import json
+
+            with open(report_file, 'w') as file:
+                json.dump(report, file, indent=2)
+
+        if filename:
+            success_msg("{0} entries written to {1}".format(export_table(pairs, filename), filename))
+
+        if not report['valid']:
+            error_msg("{} has errors, fix them before using it".format(ospath.basename(dict_file_name)))
+            # Fails the run so scripts stop before rewriting a tree with it
+            sys.exit(1)
     else:
         warning_msg(MSG.NO_MODE_SELECTED.value)
 
+    if changes is not None:
+        changes.write(dry_run)
+        success_msg("Dry run, {0} edits to {1} files written to {2}".format(
+            changes.edit_count(), len(changes.files), dry_run))
+    else:
+        save_file_index()
+
+    if result_cache is not None:
+        with STATS.timer('result_cache'):
+            result_cache.prune()
+
+    if profile:
+        total_time = perf_counter() - start_time
+        print(STATS.report(total_time))
+
+        if stats_file:
+            import json
+
+            with open(stats_file, 'w') as file:
+                json.dump(STATS.to_dict(total_time), file, indent=2)
+
+
 if __name__ == "__main__":
-   main(sys.argv[1:])
\ No newline at end of file
+    try:
+        main(sys.argv[1:])
+    except PatcherError as error:
+        exit_with_msg(str(error))
@@ -0,0 +1,116 @@
+# Pipeline mode, update, patch and verify in a single process
+
+from os import getcwd, path as ospath
+from common import (MISSES, STATS, BatchWriter, convert, getPatchedChecksums, get_files,
+                    get_full_path, get_index_entry, read_ahead, read_file, read_source,
+                    record_index_entry, verifyMd5, warning_msg)
+from patch import get_patch_targets, patch_data
+from patch_spec import UNKNOWN, UNPATCHED
+from update import ALREADY_PATCHED, UNCHANGED, UPDATED, cached_rewrite_file, is_update_indexed, rewrite_bytes
+
+
+def run_pipeline(path, dictionary, backup, silent, table=None, manifest=None, specs=None, changes=None):
+    # Runs update, patch and verify in one process, every file is read at most once
+    # and written at most once, verify uses the checksums of what was written.
+    # With changes, what would be written is recorded there instead and nothing is verified
+    if path == '':
+        path = getcwd()
+
+    patched_checksums = getPatchedChecksums(True)
+    sfse_path = get_full_path(path, convert([115, 102, 115, 101]))
+    buffers = {}
+    updated = {}
+    # Content before the run and the hex values replaced, for the change manifest
+    originals = {}
+
+    files_to_update = []
+    for file in get_files(sfse_path):
+        file_with_path = get_full_path(sfse_path, file)
+
+        if table is not None and is_update_indexed(file_with_path, table):
+            print('{} unchanged since last run, skipping!'.format(file))
+        else:
+            files_to_update.append(file_with_path)
+
+    # Update hex values, the next files are read while the current one is rewritten
+    for file_with_path, (data, checksum) in read_ahead(files_to_update, read_source):
+        if checksum in patched_checksums:
+            print('{} already patched, skipping!'.format(ospath.basename(file_with_path)))
+            updated[file_with_path] = ALREADY_PATCHED
+            continue
+
+        if changes is not None:
+            edits = []
+            with STATS.timer('rewrite'):
+                new_data, _ = rewrite_bytes(data, dictionary, file_with_path, edits)
+        else:
+            new_data = cached_rewrite_file(file_with_path, dictionary, checksum, data)
+        updated[file_with_path] = UPDATED if new_data is not None else UNCHANGED
+
+        if new_data is not None:
+            buffers[ospath.abspath(file_with_path)] = (file_with_path, new_data)
+            if changes is not None:
+                originals[ospath.abspath(file_with_path)] = (data, edits)
+
+    # Patch loader, working on the updated bytes if the file was updated
+    patched_files = []
+
+    for file, path_to_file, file_specs in get_patch_targets(path, specs):
+        entry = get_index_entry(path_to_file)
+        if entry is not None and entry['patched']:
+            if not silent:
+                warning_msg("{} already patched".format(file))
+            continue
+
+        key = ospath.abspath(path_to_file)
+        if key in buffers:
+            data = buffers[key][1]
+        else:
+            data = read_file(path_to_file)
+            if changes is not None:
+                originals[key] = (data, None)
+
+        state, data = patch_data(file, data, file_specs, silent)
+
+        if state == UNPATCHED:
+            buffers[key] = (path_to_file, data)
+            if changes is not None and originals[key][1] is not None:
+                # Updated and patched, the edits are worked out from the lines instead
+                originals[key] = (originals[key][0], None)
+        if state != UNKNOWN:
+            patched_files.append(path_to_file)
+
+    if changes is not None:
+        updated_keys = set(ospath.abspath(file) for file, state in updated.items() if state == UPDATED)
+        for key, (file_with_path, data) in buffers.items():
+            original, edits = originals[key]
+            changes.record(file_with_path, original, data, edits, updated=key in updated_keys)
+
+        if MISSES.total():
+            warning_msg(MISSES.summary())
+
+        return True
+
+    # Write every changed file once and swap them in together
+    with BatchWriter(backup) as batch:
+        for file_with_path, data in buffers.values():
+            batch.stage(file_with_path, data)
+
+    for file_with_path in updated:
+        record_index_entry(file_with_path, table=table)
+
+    for path_to_file in patched_files:
+        record_index_entry(path_to_file, patched=True)
+
+    if MISSES.total():
+        warning_msg(MISSES.summary())
+
+    # Verify files were patched
+    files = get_files(path, True)
+    if len(files) == 0:
+        return False
+
+    with STATS.timer('verify'):
+        verifyMd5(files, silent, manifest, path)
+
+    return True
@@ -0,0 +1,113 @@
+# Content addressed cache of update results, shared between runs and machines
+# patching the same SFSE commit with the same hex table
+#
+# An entry is keyed by the checksum of the source file, the checksum of the hex
+# table (and how it's matched) and the patcher version, and holds the rewritten
+# bytes. An empty entry records that the table doesn't change the file.
+# Entries are touched when they're used and the least recently used ones are
+# removed once the cache grows past its size limit.
+
+import hashlib
+import os
+from os import path as ospath
+from tempfile import mkstemp
+from common import default_file_mode
+
+DEFAULT_SIZE = 256 * 1024 * 1024
+
+
+def entry_key(source_checksum, table_key, version):
+    return hashlib.sha256('{0}\0{1}\0{2}'.format(source_checksum, table_key, version).encode('ascii')).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, directory, table_key, version, max_size=DEFAULT_SIZE):
+        self.directory = directory
+        self.table_key = table_key
+        self.version = version
+        self.max_size = max_size
+
+    def entry_path(self, source_checksum):
+        key = entry_key(source_checksum, self.table_key, self.version)
+
+        return ospath.join(self.directory, key[:2], key)
+
+    def get(self, source_checksum):
+        # Returns (True, bytes or None) on a hit, (False, None) on a miss
+        path = self.entry_path(source_checksum)
+
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return False, None
+
+        try:
+            # Mark it as recently used
+            os.utime(path)
+        except OSError:
+            pass
+
+        return True, data or None
+
+    def put(self, source_checksum, data):
+        path = self.entry_path(source_checksum)
+        directory = ospath.dirname(path)
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fh, tmp_path = mkstemp(dir=directory)
+        except OSError:
+            # Read only cache, just don't store it
+            return
+
+        try:
+            with os.fdopen(fh, 'wb') as file:
+                file.write(data or b'')
+
+            # Readable by everyone sharing the cache, like any other file
+            default_file_mode(tmp_path)
+
+            # Another run might store the same entry, both hold the same bytes
+            os.replace(tmp_path, path)
+        finally:
+            if ospath.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def prune(self):
+        # Removes the least recently used entries until the cache fits, returns how many
+        entries = []
+        total = 0
+
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                # Skip entries other runs are still writing
+                if name.startswith('tmp'):
+                    continue
+
+                path = ospath.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+                total += stat.st_size
+
+        removed = 0
+        entries.sort()
+
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            total -= size
+            removed += 1
+
+        return removed
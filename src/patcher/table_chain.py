@@ -0,0 +1,107 @@
+# Chains of hex tables, for moving a tree across several game versions in one update
+#
+# The tables are composed into one table mapping the addresses of the first version
+# straight to the last one. It gives the same result as running update once per
+# table, addresses a table has no entry for are passed on unchanged. Composed tables
+# are cached in a composed folder next to the first table, named after the first
+# and last table and a digest of every table in the chain, so a chain is only
+# composed again once one of its tables changes.
+
+import os
+from hashlib import md5
+from os import path as ospath
+from tempfile import gettempdir
+from common import STATS, generate_checksum, get_dict
+from generate import write_hex_table
+
+COMPOSED_DIR = 'composed'
+
+
+def table_version(path):
+    # hex_table_1.15.216_173ff07.json -> 1.15.216_173ff07
+    name = ospath.splitext(ospath.basename(path))[0]
+
+    return name[len('hex_table_'):] if name.startswith('hex_table_') else name
+
+
+def chain_digest(paths):
+    digest = md5()
+
+    for path in paths:
+        digest.update(generate_checksum(path, True).encode('ascii'))
+
+    return digest.hexdigest()
+
+
+def composed_prefix(paths):
+    return 'hex_table_{0}_to_{1}_'.format(table_version(paths[0]), table_version(paths[-1]))
+
+
+def composed_path(paths, directory):
+    return ospath.join(directory, '{0}{1}.json'.format(composed_prefix(paths), chain_digest(paths)[:8]))
+
+
+def compose(tables):
+    composed = {}
+
+    for table in tables:
+        # Addresses already mapped move on through this table
+        for key, value in composed.items():
+            new_value = table.get(value)
+            if new_value is not None:
+                composed[key] = new_value
+
+        # and the ones only this table knows are added as they are
+        for key, value in table.items():
+            if key not in composed:
+                composed[key] = value
+
+    return composed
+
+
+def compose_chain(paths, directory=None):
+    # Returns the path of the table composed from the chain, composing it if it isn't cached
+    if len(paths) == 1:
+        return paths[0]
+
+    if directory is None:
+        directory = ospath.join(ospath.dirname(ospath.abspath(paths[0])), COMPOSED_DIR)
+
+    target = composed_path(paths, directory)
+    if ospath.exists(target):
+        STATS.count('composed_cache_hits')
+        return target
+
+    # Start from the longest part of the chain that was composed before
+    start = [paths[0]]
+    rest = paths[1:]
+    for idx in range(len(paths) - 1, 1, -1):
+        cached = composed_path(paths[:idx], directory)
+        if ospath.exists(cached):
+            start = [cached]
+            rest = paths[idx:]
+            break
+
+    with STATS.timer('compose'):
+        composed = compose(get_dict(path) for path in start + rest)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        write_hex_table(composed.items(), target)
+    except OSError:
+        # Read only table folder, compose into the temp folder instead
+        directory = ospath.join(gettempdir(), COMPOSED_DIR)
+        os.makedirs(directory, exist_ok=True)
+        target = composed_path(paths, directory)
+        write_hex_table(composed.items(), target)
+
+    # Tables composed from older versions of the same chain
+    prefix = composed_prefix(paths)
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name != ospath.basename(target):
+            try:
+                os.remove(ospath.join(directory, name))
+            except OSError:
+                pass
+
+    return target
@@ -0,0 +1,174 @@
+# Table mode, checks a hex table before it's used on a tree
+#
+# The table is loaded once with every pair kept, duplicates included, and
+# checked in one pass plus a sort:
+#   errors:   invalid hex values, and old addresses given different new addresses
+#             (also when they only differ by case, the table matcher ignores case)
+#   warnings: duplicate pairs, pairs mapping an address to itself, new addresses
+#             that are also old addresses (rewriting twice would move them again)
+#             and new addresses with a different number of digits
+# Coverage against a source tree counts the hex values of each file that the
+# table has a replacement for, the same way update looks them up.
+
+import json
+import re
+from collections import Counter
+from os import path as ospath
+from common import STATS, InvalidTableError, get_files, get_full_path, read_ahead, read_file
+
+HEX_VALUE = re.compile(r'0[xX][0-9a-fA-F]{7,}')
+HEX_PATTERN = re.compile(rb'0[xX][0-9a-fA-F]{7,}')
+
+# Hit rate buckets of the per file histogram, in tenths
+BUCKETS = 10
+
+
+def load_table_pairs(path):
+    # Every (old, new) pair in the order it's written, unlike get_dict which keeps the last duplicate
+    from binary_table import BinaryHexTable, is_binary_table
+
+    with STATS.timer('dictionary_load'):
+        try:
+            if is_binary_table(path):
+                with BinaryHexTable(path) as table:
+                    return list(table.items())
+
+            with open(path, 'r') as file:
+                pairs = json.load(file, object_pairs_hook=list)
+        except (OSError, ValueError):
+            raise InvalidTableError("Hex table {} not found or not a table".format(path))
+
+    # Anything but an object of pairs at the top
+    if not isinstance(pairs, list) or not all(isinstance(pair, tuple) for pair in pairs):
+        raise InvalidTableError("Hex table {} not found or not a table".format(path))
+
+    return pairs
+
+
+def validate_table(pairs):
+    errors = {'invalid': [], 'conflicts': []}
+    warnings = {'duplicates': [], 'identity': [], 'overlaps': [], 'width_changes': []}
+
+    values = {}
+    folded = {}
+    counts = Counter()
+
+    for old_hex, new_hex in pairs:
+        if not isinstance(old_hex, str) or not isinstance(new_hex, str) or \
+                not HEX_VALUE.fullmatch(old_hex) or not HEX_VALUE.fullmatch(new_hex):
+            errors['invalid'].append([old_hex, new_hex])
+            continue
+
+        counts[(old_hex, new_hex)] += 1
+        values.setdefault(old_hex, set()).add(new_hex)
+        folded.setdefault(old_hex.lower(), set()).add(new_hex.lower())
+
+        if old_hex == new_hex:
+            warnings['identity'].append(old_hex)
+        elif len(old_hex) != len(new_hex):
+            warnings['width_changes'].append([old_hex, new_hex])
+
+    for (old_hex, new_hex), count in counts.items():
+        if count > 1:
+            warnings['duplicates'].append([old_hex, new_hex, count])
+
+    # Sorted so the same table always gives the same report
+    for old_hex in sorted(folded):
+        if len(folded[old_hex]) > 1:
+            errors['conflicts'].append({'address': old_hex, 'values': sorted(folded[old_hex])})
+
+    warnings['overlaps'] = sorted(set(new_hex for old_hex, new_hex in counts
+                                      if old_hex != new_hex and new_hex.lower() in folded))
+
+    return {
+        'entries': len(pairs),
+        'addresses': len(values),
+        'valid': not any(errors.values()),
+        'errors': errors,
+        'warnings': warnings
+    }
+
+
+def table_coverage(table, path):
+    # Hit rate of the table on each file of the tree, and on the tree as a whole
+    files = get_files(path)
+    per_file = {}
+    used = set()
+    histogram = [0] * BUCKETS
+    total_values = 0
+    total_hits = 0
+
+    for file, data in read_ahead([get_full_path(path, file) for file in files], read_file):
+        found = [match.decode('ascii') for match in HEX_PATTERN.findall(data)]
+        hits = [hex_value for hex_value in found if hex_value in table]
+        used.update(hits)
+
+        total_values += len(found)
+        total_hits += len(hits)
+
+        if found:
+            rate = len(hits) / len(found)
+            histogram[min(int(rate * BUCKETS), BUCKETS - 1)] += 1
+            per_file[ospath.basename(file)] = {'values': len(found), 'hits': len(hits), 'rate': rate}
+
+    return {
+        'files': len(files),
+        'values': total_values,
+        'hits': total_hits,
+        'rate': total_hits / total_values if total_values else 0.0,
+        'used_entries': len(used),
+        'histogram': histogram,
+        'per_file': per_file
+    }
+
+
+def normalise_table(pairs):
+    # Valid pairs only, without duplicates or identities, the last of conflicting pairs wins like get_dict.
+    # Addresses only differing by case conflict as well, so the export passes validate_table
+    table = {}
+
+    for old_hex, new_hex in pairs:
+        if isinstance(old_hex, str) and isinstance(new_hex, str) and old_hex.lower() != new_hex.lower() and \
+                HEX_VALUE.fullmatch(old_hex) and HEX_VALUE.fullmatch(new_hex):
+            table[old_hex.lower()] = (old_hex, new_hex)
+
+    return sorted(table.values())
+
+
+def export_table(pairs, path):
+    # Binary tables are written for a .bin filename, json otherwise
+    from binary_table import EXTENSION, write_binary_table
+    from generate import write_hex_table
+
+    table = normalise_table(pairs)
+
+    if path.endswith(EXTENSION):
+        write_binary_table(dict(table), path)
+    else:
+        write_hex_table(table, path)
+
+    return len(table)
+
+
+def format_report(report, limit=5):
+    lines = ["{0} entries, {1} addresses, table is {2}".format(
+        report['entries'], report['addresses'], 'valid' if report['valid'] else 'INVALID')]
+
+    for level in ('errors', 'warnings'):
+        for check, found in report[level].items():
+            if found:
+                shown = ', '.join(str(item) for item in found[:limit])
+                more = ' ...' if len(found) > limit else ''
+                lines.append("  {0} {1}: {2} ({3}{4})".format(level[:-1], check, len(found), shown, more))
+
+    coverage = report.get('coverage')
+    if coverage is not None:
+        lines.append("Coverage: {0} of {1} hex values in {2} files have a replacement ({3:.1%}), "
+                     "{4} entries used".format(coverage['hits'], coverage['values'], coverage['files'],
+                                               coverage['rate'], coverage['used_entries']))
+        lines.append("  Files by hit rate:")
+        for bucket, count in enumerate(coverage['histogram']):
+            lines.append("    {0:>3}-{1:>3}%: {2}".format(bucket * 100 // BUCKETS,
+                                                        (bucket + 1) * 100 // BUCKETS, count))
+
+    return '\n'.join(lines)
@@ -0,0 +1,265 @@
+# Update mode, replaces the hex values of the source files using a hex table
+
+import os
+import re
+from itertools import repeat
+from os import path as ospath
+from common import (MISSES, STATS, VERSION, BatchWriter, MappedFile, generate_checksum,
+                    getPatchedChecksums, get_index_entry, read_ahead, read_source,
+                    record_index_entry)
+from hex_matcher import HexMatcher
+from result_cache import DEFAULT_SIZE as DEFAULT_CACHE_SIZE, ResultCache
+
+# Matches hex addresses, compiled once and shared by every file. Sources are
+# matched as bytes so they're never decoded and keep their line endings
+HEX_PATTERN = re.compile(rb'0[xX][0-9a-fA-F]{7,}')
+
+# Cache of update results shared between runs, opened by main() with --cache
+_result_cache = None
+
+# What update() did to a file
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+ALREADY_PATCHED = 'already_patched'
+
+
+def get_replacement_hex(hex_to_find, dictionary, source=None):
+    try:
+        new_hex = dictionary[hex_to_find]
+        STATS.count('lookup_hits')
+        return new_hex
+    except KeyError:
+        # Collected and summarised once the run finishes
+        STATS.count('lookup_misses')
+        MISSES.add(hex_to_find, source)
+
+
+def rewrite_bytes(data, dictionary, source=None, edits=None):
+    # Replace every hex value in a single pass, returns the new bytes (None if
+    # nothing changed) and the number of values that were replaced. The output is
+    # built from slices of the original and the replacements, joined once.
+    # Each replacement is added to edits as (offset, old, new) if it's given
+    if isinstance(dictionary, HexMatcher):
+        # Only matches addresses in the table, so there's nothing to report as missing
+        pattern = dictionary.bytes_pattern
+        lookup = dictionary.get
+    else:
+        pattern = HEX_PATTERN
+
+        def lookup(old_hex):
+            return get_replacement_hex(old_hex, dictionary, source)
+
+    parts = []
+    last = 0
+
+    for match in pattern.finditer(data):
+        new_hex = lookup(match.group(0).decode('ascii'))
+
+        # no hex, leave it alone
+        if new_hex is None:
+            continue
+
+        parts.append(data[last:match.start()])
+        parts.append(new_hex.encode('ascii'))
+        last = match.end()
+
+        if edits is not None:
+            edits.append((match.start(), match.group(0), parts[-1]))
+
+    hits = len(parts) // 2
+    if isinstance(dictionary, HexMatcher):
+        STATS.count('lookup_hits', hits)
+
+    if not hits:
+        return None, 0
+
+    parts.append(data[last:])
+
+    return b''.join(parts), hits
+
+
+def rewrite_file(file_with_path, dictionary, data=None):
+    # Returns the rewritten bytes of a file, or None if no hex value was replaced.
+    # The file is mapped unless its content was already read
+    with STATS.timer('rewrite'):
+        if data is not None:
+            new_data, _ = rewrite_bytes(data, dictionary, file_with_path)
+        else:
+            with MappedFile(file_with_path) as data:
+                new_data, _ = rewrite_bytes(data, dictionary, file_with_path)
+
+    return new_data
+
+
+def open_result_cache(directory, table_path, matcher, max_size=None):
+    global _result_cache
+
+    # The matcher is part of the key, table and regex can rewrite a file differently
+    table_key = '{0}:{1}'.format(generate_checksum(table_path, True), matcher)
+    _result_cache = ResultCache(directory, table_key, VERSION, max_size or DEFAULT_CACHE_SIZE)
+
+    return _result_cache
+
+
+def cached_rewrite_file(file_with_path, dictionary, checksum, data=None):
+    # rewrite_file, reusing the result of a previous run on the same file and table.
+    # Misses aren't reported again for files served from the cache
+    if _result_cache is None:
+        return rewrite_file(file_with_path, dictionary, data)
+
+    with STATS.timer('result_cache'):
+        hit, new_data = _result_cache.get(checksum)
+
+    if hit:
+        STATS.count('result_cache_hits')
+        return new_data
+
+    new_data = rewrite_file(file_with_path, dictionary, data)
+
+    with STATS.timer('result_cache'):
+        _result_cache.put(checksum, new_data)
+
+    return new_data
+
+
+def update(file_with_path, dictionary, backup, patched_checksums=None, batch=None, source=None):
+    # Prevent patcher from running on the same file twice
+    # potentially changing new addresses
+    if patched_checksums is None:
+        patched_checksums = getPatchedChecksums(True)
+
+    # source is the (content, checksum) of the file if it was read ahead
+    if source is None:
+        data, checksum = None, generate_checksum(file_with_path, True)
+    else:
+        data, checksum = source
+
+    if checksum in patched_checksums:
+        print('{} already patched, skipping!'.format(
+            ospath.basename(file_with_path)))
+        # The file already holds the new addresses
+        return ALREADY_PATCHED
+
+    new_data = cached_rewrite_file(file_with_path, dictionary, checksum, data)
+
+    # Only replace if patched
+    if new_data is not None:
+        if batch is None:
+            with BatchWriter(backup) as file_batch:
+                file_batch.stage(file_with_path, new_data)
+        else:
+            batch.stage(file_with_path, new_data)
+
+    return UPDATED if new_data is not None else UNCHANGED
+
+
+# Per process state for the update workers, set once by the pool initializer
+# so the dictionary isn't pickled again for every file
+_worker_state = {}
+
+
+def init_update_worker(dictionary, patched_checksums, profile=False, result_cache=None):
+    global _result_cache
+
+    _worker_state['dictionary'] = dictionary
+    _worker_state['patched_checksums'] = patched_checksums
+    _result_cache = result_cache
+
+    # Forked workers start with a copy of the parent's stats
+    STATS.snapshot()
+    MISSES.snapshot()
+    STATS.enabled = profile
+
+
+def update_worker(file_with_path, backup):
+    # Files are only staged here, the parent commits them with the rest of the batch
+    batch = BatchWriter(backup, journal=False)
+    state = update(file_with_path, _worker_state['dictionary'],
+                   backup, _worker_state['patched_checksums'], batch)
+
+    # Send the stats and misses collected for this file back to be merged
+    return state, batch.staged, STATS.snapshot() if STATS.enabled else None, MISSES.snapshot()
+
+
+def dry_run_files(files, dictionary, changes, table=None):
+    # Records what update_files would change in changes, without writing anything.
+    # Files are skipped the same way, the result cache is skipped as it only holds
+    # the rewritten files, not the edits
+    patched_checksums = getPatchedChecksums(True)
+
+    files_to_update = []
+    for file in files:
+        if table is not None and is_update_indexed(file, table):
+            print('{} unchanged since last run, skipping!'.format(
+                ospath.basename(file)))
+        else:
+            files_to_update.append(file)
+
+    for file, (data, checksum) in read_ahead(files_to_update, read_source):
+        if checksum in patched_checksums:
+            print('{} already patched, skipping!'.format(ospath.basename(file)))
+            continue
+
+        edits = []
+        with STATS.timer('rewrite'):
+            new_data, _ = rewrite_bytes(data, dictionary, file, edits)
+
+        if new_data is not None:
+            changes.record(file, data, new_data, edits, updated=True)
+
+
+def is_update_indexed(file, table):
+    # Skip files that haven't changed since a previous run checked them against
+    # the same table, table is its checksum so a table edited in place or another
+    # table with the same name is applied again. Files updated by any other table
+    # are caught by the patched checksums instead
+    entry = get_index_entry(file)
+    if entry is None:
+        return False
+
+    return entry['table'] == table
+
+
+def update_files(files, dictionary, backup, jobs=1, table=None):
+    # Load the patched checksums once and share them with every file
+    patched_checksums = getPatchedChecksums(True)
+
+    files_to_update = []
+    for file in files:
+        if table is not None and is_update_indexed(file, table):
+            print('{} unchanged since last run, skipping!'.format(
+                ospath.basename(file)))
+        else:
+            files_to_update.append(file)
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    with BatchWriter(backup) as batch:
+        if jobs == 1 or len(files_to_update) < 2:
+            # The next files are read while the current one is rewritten
+            results = [update(file, dictionary, backup, patched_checksums, batch, source)
+                       for file, source in read_ahead(files_to_update, read_source)]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            jobs = min(jobs, len(files_to_update))
+            chunksize = max(1, len(files_to_update) // (jobs * 4))
+
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_update_worker,
+                                     initargs=(dictionary, patched_checksums, STATS.enabled,
+                                               _result_cache)) as executor:
+                results = []
+                for state, staged, stats, misses in executor.map(update_worker, files_to_update,
+                                                                 repeat(backup), chunksize=chunksize):
+                    batch.adopt(staged)
+                    if stats is not None:
+                        STATS.merge(stats)
+                    MISSES.merge(misses)
+                    results.append(state)
+
+    for file, state in zip(files_to_update, results):
+        record_index_entry(file, table=table)
+
+    # What was done to each file, files skipped as unchanged since the last run aren't included
+    return dict(zip(files_to_update, results))
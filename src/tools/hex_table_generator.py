@@ -1,9 +1,16 @@
 # Creates a hex table of the two different Address Libraries
 # Be aware this will create a much bigger files that the ones in hex_table folder
+# If numpy is installed the libraries are parsed and diffed in bulk, which is much
+# faster for full libraries, otherwise it falls back to plain python
 
 import json
 import os
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 def convert_add_lib_to_hex_map(lib):
     hex_list = {}
@@ -26,7 +33,36 @@ def convert_add_lib_to_hex_map(lib):
     return hex_list
 
 
-def gen_hex_table(steam_path, win_path):
+def load_add_lib_arrays(lib):
+    # Parse the whole library in one go into id and address arrays
+    table = np.loadtxt(lib, dtype=[('id', np.int64), ('addr', 'U32')],
+                       usecols=(0, -1), comments=None, ndmin=1)
+
+    return table['id'], table['addr']
+
+
+def fix_addr_array(addrs):
+    # add hex format to addr for easy lookup
+    return np.char.add('0x0', np.char.partition(addrs, 'x')[:, 2])
+
+
+def diff_add_lib_arrays(steam_path, win_path):
+    steam_ids, steam_addrs = load_add_lib_arrays(steam_path)
+    win_ids, win_addrs = load_add_lib_arrays(win_path)
+
+    # Join both libraries on id with a sorted merge, ids missing from either are dropped
+    _, steam_idx, win_idx = np.intersect1d(
+        steam_ids, win_ids, assume_unique=False, return_indices=True)
+
+    old_addrs = steam_addrs[steam_idx]
+    new_addrs = win_addrs[win_idx]
+    changed = old_addrs != new_addrs
+
+    return dict(zip(fix_addr_array(old_addrs[changed]).tolist(),
+                    fix_addr_array(new_addrs[changed]).tolist()))
+
+
+def diff_add_lib_maps(steam_path, win_path):
     steam = convert_add_lib_to_hex_map(steam_path)
     win = convert_add_lib_to_hex_map(win_path)
 
@@ -40,6 +76,15 @@ def gen_hex_table(steam_path, win_path):
             # ID doesn't exists
             continue
 
+    return hex_dict
+
+
+def gen_hex_table(steam_path, win_path):
+    if np is not None:
+        hex_dict = diff_add_lib_arrays(steam_path, win_path)
+    else:
+        hex_dict = diff_add_lib_maps(steam_path, win_path)
+
     # dump to file
     with open("diff.json", "w") as f:
         f.write(json.dumps(hex_dict))
@@ -56,12 +101,12 @@ def check_file_path(file: str):
         exit("File not found")
 
 
-steam_path = check_file_path(input('Steam address library file path: '))
-win_path = check_file_path(input('Windows address library file path: '))
+if __name__ == "__main__":
+    steam_path = check_file_path(input('Steam address library file path: '))
+    win_path = check_file_path(input('Windows address library file path: '))
 
+    try:
+        gen_hex_table(steam_path, win_path)
 
-try:
-    gen_hex_table(steam_path, win_path)
-
-except Exception as err:
-    print(err)
+    except Exception as err:
+        print(err)